@@ -1,7 +1,8 @@
 from pathlib import Path
-from decouple import config
+from decouple import config, Csv
 
 API_PORT = int(config('API_PORT'))
+API_WORKERS = config('API_WORKERS', default=1, cast=int)
 
 LANGUAGE = config('LANGUAGE')
 LABEL_NAME = config('LABEL_NAME')
@@ -9,6 +10,27 @@ ANCESTOR_NAME = config('ANCESTOR_NAME')
 PROPERTY_NAME = config('PROPERTY_NAME')
 EXCLUDED_PREFIX = str(config('EXCLUDED_PREFIX')).split(',')
 SHOW_ORIGIN = config('SHOW_ORIGIN') == 'True'
+REVISION_SIMILARITY = config('REVISION_SIMILARITY', default=0.5, cast=float)
+PRECOMPUTE_LEVELS = config('PRECOMPUTE_LEVELS', default=False, cast=bool)
+PRECOMPUTE_WORKERS = config('PRECOMPUTE_WORKERS', default=2, cast=int)
+MAX_SESSIONS = config('MAX_SESSIONS', default=16, cast=int)
+BASE_VOCABULARIES = config('BASE_VOCABULARIES', default='', cast=Csv())
+STATE_DATABASE = config('STATE_DATABASE', default='')
+LOG_LEVEL = config('LOG_LEVEL', default='INFO')
+LOG_MAX_BYTES = config('LOG_MAX_BYTES', default=10485760, cast=int)
+LOG_BACKUPS = config('LOG_BACKUPS', default=3, cast=int)
+TRACE_ALLOCATIONS = config('TRACE_ALLOCATIONS', default=False, cast=bool)
+TRACE_FRAMES = config('TRACE_FRAMES', default=1, cast=int)
+TRACE_TOP = config('TRACE_TOP', default=10, cast=int)
+LAYOUT_ITERATIONS = config('LAYOUT_ITERATIONS', default=50, cast=int)
+LAYOUT_DISTANCE = config('LAYOUT_DISTANCE', default=100, cast=float)
+RENDER_WORKERS = config('RENDER_WORKERS', default=1, cast=int)
+RENDER_CACHE = config('RENDER_CACHE', default=32, cast=int)
+ADMIN_TOKEN = config('ADMIN_TOKEN', default='')
+PROFILE_LIMIT = config('PROFILE_LIMIT', default=20, cast=int)
+PROFILE_TOP = config('PROFILE_TOP', default=30, cast=int)
+PROGRESS_KEEPALIVE = config('PROGRESS_KEEPALIVE', default=15, cast=float)
+NDJSON_CHUNK = config('NDJSON_CHUNK', default=500, cast=int)
 
 STROKE_SUBCLASS = int(config('STROKE_SUBCLASS'))
 STROKE_OTHER = int(config('STROKE_OTHER'))
@@ -0,0 +1,122 @@
+MEDIA_TYPE = 'application/vnd.csum.columnar+msgpack'
+MEDIA_TYPES = [MEDIA_TYPE, 'application/x-msgpack', 'application/msgpack']
+VERSION = 1
+
+# kinds of columns
+STRING = 's'
+STRINGS = 'l'
+VALUE = 'v'
+
+
+def accepts(accept: str) -> bool:
+    """
+    Checks if the client asked for the columnar format
+    :param accept: value of the Accept header
+    :return: True if one of the columnar media types is accepted
+    """
+    if not accept:
+        return False
+    return any(media.split(';')[0].strip() in MEDIA_TYPES for media in accept.split(','))
+
+
+def encode(graph_json: dict) -> bytes:
+    """
+    Packs visualization into integer-indexed columns with a shared string table
+    :param graph_json: json-like graph structure
+    :return: msgpack payload
+    """
+    strings = _StringTable()
+    payload = {
+        'version': VERSION,
+        'graph': graph_json.get('graph'),
+        'nodes': _encode_rows(graph_json.get('nodes', []), strings),
+        'links': _encode_rows(graph_json.get('links', []), strings),
+    }
+    payload['strings'] = strings.values
+    import msgpack
+    return msgpack.packb(payload, use_bin_type=True)
+
+
+def decode(payload: bytes) -> dict:
+    """
+    Restores visualization from the columnar payload
+    :param payload: msgpack payload made by encode
+    :return: json-like graph structure
+    """
+    import msgpack
+    data = msgpack.unpackb(payload, raw=False)
+    if data.get('version') != VERSION:
+        raise ValueError("Unsupported version of columnar payload: {}".format(data.get('version')))
+    strings = data['strings']
+    return {
+        'nodes': _decode_rows(data['nodes'], strings),
+        'links': _decode_rows(data['links'], strings),
+        'graph': data['graph'],
+    }
+
+
+class _StringTable:
+    def __init__(self):
+        self.values = []
+        self._index = dict()
+
+    def __call__(self, value: str) -> int:
+        value = str(value)
+        index = self._index.get(value)
+        if index is None:
+            index = len(self.values)
+            self._index[value] = index
+            self.values.append(value)
+        return index
+
+
+def _kind(values: list) -> str:
+    if all(isinstance(value, str) for value in values):
+        return STRING
+    if all(isinstance(value, list) and all(isinstance(v, str) for v in value) for value in values):
+        return STRINGS
+    return VALUE
+
+
+def _encode_rows(rows: list, strings: _StringTable) -> dict:
+    """
+    Converts list of dictionaries into columns
+    :param rows: list of nodes or links
+    :param strings: table of strings
+    :return: dictionary with number of rows and columns
+    """
+    positions = dict()
+    for i, row in enumerate(rows):
+        for key, value in row.items():
+            if key not in positions:
+                positions[key] = ([], [])
+            positions[key][0].append(i)
+            positions[key][1].append(value)
+    columns = dict()
+    for key, (indices, values) in positions.items():
+        kind = _kind(values)
+        if kind == STRING:
+            values = [strings(value) for value in values]
+        elif kind == STRINGS:
+            values = [[strings(v) for v in value] for value in values]
+        column = {'kind': kind, 'values': values}
+        # sparse column keeps only rows, where the key is present
+        if len(indices) < len(rows):
+            column['rows'] = indices
+        columns[key] = column
+    return {'count': len(rows), 'columns': columns}
+
+
+def _decode_rows(table: dict, strings: list) -> list:
+    rows = [dict() for _ in range(table['count'])]
+    for key, column in table['columns'].items():
+        kind = column['kind']
+        values = column['values']
+        if kind == STRING:
+            values = [strings[value] for value in values]
+        elif kind == STRINGS:
+            values = [[strings[v] for v in value] for value in values]
+        indices = column.get('rows', range(len(rows)))
+        for i, value in zip(indices, values):
+            rows[i][key] = value
+    return rows
@@ -1,28 +1,42 @@
-from colour import Color
-from string import digits
+from collections import Counter, namedtuple
+
 from rdflib import URIRef, Graph as RDFGraph
-from rdflib.namespace import RDFS
-from rdflib.extras.external_graph_libs import rdflib_to_networkx_digraph
-from networkx.readwrite import json_graph
+from rdflib.namespace import RDF, RDFS, OWL
+from rdflib.util import from_n3
 
 from csum import LANGUAGE, \
     LABEL_NAME, ANCESTOR_NAME, PROPERTY_NAME, \
     STROKE_SUBCLASS, STROKE_OTHER, \
     COLOUR_BASIC, COLOUR_RELATOR, COLOUR_ENDURANT1, \
     COLOUR_ENDURANT2, COLOUR_PREFIX1, COLOUR_PREFIX2
+from csum.memory import deep_size
+from csum.state import dump_triples, load_triples
+from csum.vocabulary import GUFO
+
+# anonymous superclass restricting the class, e.g. [ owl:onProperty gufo:mediates ; owl:onClass :Person ]
+# property is the inverted one, if inverse is True; fillers are values of owl:onClass, then owl:someValuesFrom;
+# cardinalities are pairs of predicate and value; typed is True, if it is declared as owl:Restriction
+Restriction = namedtuple('Restriction', ['node', 'property', 'inverse', 'fillers', 'cardinalities', 'typed'])
 
 
 class Graph:
     SUBCLASS_LABELS = ['rdfs:subClassOf', 'rdfs:subPropertyOf', 'rdf:type']
+    CARDINALITIES = [OWL.qualifiedCardinality, OWL.minQualifiedCardinality, OWL.maxQualifiedCardinality]
 
-    def __init__(self, logger):
+    def __init__(self, logger, vocabulary=None):
         self.logger = logger
         self._data = None
+        # shared base vocabularies, which are not stored in the graph
+        self._vocabulary = vocabulary
         self._description = self._get_config_basics()
         self._bind = dict()
+        # owl's terms are recognized by the prefix only
+        self._owl_bound = False
         self._relators = set()
         self._sortals = dict()
         self._nonsortals = dict()
+        # class -> list of its restrictions
+        self._restrictions = dict()
 
     @property
     def data(self):
@@ -46,12 +60,38 @@ class Graph:
         endurants.update(self._nonsortals.keys())
         return endurants
 
+    @property
+    def restrictions(self) -> dict:
+        return self._restrictions
+
+    @property
+    def classification(self) -> (set, dict, dict):
+        return self._relators, self._sortals, self._nonsortals
+
     def reset_relators(self):
         self._relators = self._get_relators()
 
     def reset_endurants(self):
         self._sortals, self._nonsortals = self._get_endurants()
 
+    def reset_restrictions(self):
+        self._restrictions = self._get_restrictions()
+
+    def remove_node(self, node):
+        """
+        Removes statements about the node and keeps restrictions up to date
+        :param node: class or restriction node
+        """
+        self._data.remove((node, None, None))
+        self._restrictions.pop(node, None)
+        for cls, restrictions in list(self._restrictions.items()):
+            if any(restriction.node == node for restriction in restrictions):
+                restrictions = [restriction for restriction in restrictions if restriction.node != node]
+                if restrictions:
+                    self._restrictions[cls] = restrictions
+                else:
+                    del self._restrictions[cls]
+
     @staticmethod
     def _get_config_basics() -> dict:
         result = dict()
@@ -64,27 +104,117 @@ class Graph:
     # Data Loading
     ##############################################
     def load_data(self, graph_data) -> bool:
+        data = self.parse_data(graph_data)
+        if data is None:
+            return False
+        self.set_data(data)
+        return True
+
+    def parse_data(self, graph_data):
+        """
+        Parses turtle data without changing the graph
+        :param graph_data: file-like object or path
+        :return: RDFGraph object or None if not able to parse
+        """
         try:
-            self._data = RDFGraph().parse(graph_data, format="turtle")
+            data = self._new_data().parse(graph_data, format="turtle")
         except:
             self.logger.error("Not able to parse the graph")
-            return False
-        else:
-            n_statements = len(self._data)
-            self.logger.info("Loaded graph has {} statements".format(n_statements))
-            self._description['origin_statements'] = n_statements
-            # set up bindings of the rdf graph
-            self._bind = self._set_binds()
-            # set up of gufo's properties of the graph
-            self._relators = self._get_relators()
-            self._sortals, self._nonsortals = self._get_endurants()
-            return True
+            return None
+        if self._vocabulary:
+            self.logger.info("{} statements are shared with base vocabularies".format(data.shared))
+        return data
+
+    def _new_data(self) -> RDFGraph:
+        # statements of the base vocabularies are not stored in the graph, but read through
+        return self._vocabulary.layer() if self._vocabulary else RDFGraph()
+
+    def set_data(self, data: RDFGraph):
+        """
+        Replaces graph content and classifies it
+        :param data: parsed RDFGraph object
+        """
+        self._data = data
+        n_statements = len(self._data)
+        self.logger.info("Loaded graph has {} statements".format(n_statements))
+        self._description['origin_statements'] = n_statements
+        # set up bindings of the rdf graph
+        self._bind = self._set_binds()
+        self._owl_bound = self.reduce_prefix(str(OWL.Restriction))[0] == 'owl:Restriction'
+        # set up of gufo's properties of the graph
+        self._relators = self._get_relators()
+        self._sortals, self._nonsortals = self._get_endurants()
+        self._restrictions = self._get_restrictions()
+
+    def apply_revision(self, revision):
+        """
+        Replays re-uploaded changes on the graph,
+        classification is re-run only if the changes could affect it
+        :param revision: Revision object
+        """
+        revision.apply(self._data)
+        self._description['origin_statements'] = revision.n_statements
+        if revision.affects_classification:
+            self.reset_relators()
+            self.reset_endurants()
+        if not revision.is_local:
+            # restrictions are read by structural predicates only
+            self.reset_restrictions()
+
+    def dump(self) -> dict:
+        """
+        Serializes the graph, so it can be restored by another worker
+        :return: dictionary with namespaces and triples
+        """
+        return {'namespaces': [[prefix, str(namespace)] for prefix, namespace in self._data.namespaces()],
+                'triples': dump_triples(self._data)}
+
+    def restore(self, record: dict):
+        """
+        Restores the graph serialized by dump
+        :param record: dictionary with namespaces and triples
+        """
+        data = self._new_data()
+        for prefix, namespace in record['namespaces']:
+            data.bind(prefix, namespace, override=True)
+        for triple in load_triples(record['triples']):
+            data.add(triple)
+        self.set_data(data)
+
+    def diff(self, previous) -> dict:
+        """
+        Serializes changes made to the graph of the previous level
+        :param previous: Graph object of the previous level
+        :return: dictionary with added, removed triples and classification
+        """
+        old = set(previous.data)
+        new = set(self._data)
+        return {'added': dump_triples(new - old),
+                'removed': dump_triples(old - new),
+                'relators': [relator.n3() for relator in self._relators],
+                'sortals': [[sortal.n3(), color] for sortal, color in self._sortals.items()],
+                'nonsortals': [[nonsortal.n3(), color] for nonsortal, color in self._nonsortals.items()]}
+
+    def apply_diff(self, delta: dict):
+        """
+        Replays changes serialized by diff on the copy of the previous level
+        :param delta: dictionary with added, removed triples and classification
+        """
+        for triple in load_triples(delta['removed']):
+            self._data.remove(triple)
+        for triple in load_triples(delta['added']):
+            self._data.add(triple)
+        self._relators = set(from_n3(relator) for relator in delta['relators'])
+        self._sortals = {from_n3(sortal): color for sortal, color in delta['sortals']}
+        self._nonsortals = {from_n3(nonsortal): color for nonsortal, color in delta['nonsortals']}
+        self.reset_restrictions()
 
     def _set_binds(self) -> dict:
         result = dict()
         # self._data.namespaces() is a generator
         namespaces = list(self._data.namespaces())
         n = len(namespaces)
+        from colour import Color
         colors = list(Color(COLOUR_PREFIX1).range_to(Color(COLOUR_PREFIX2), n))
         for (prefix, namespace), color in zip(namespaces, colors):
             ns = str(namespace)
@@ -93,33 +223,93 @@ class Graph:
             result[ns] = (prefix, str(color))
         return result
 
-    def _get_relators(self) -> set:
+    def _transitive_subjects(self, predicate, name: str) -> set:
+        """
+        Finds nodes transitively connected to gufo's term,
+        also through the nodes of the base vocabularies
+        :param predicate: rdf:type or rdfs:subClassOf
+        :param name: name of gufo's term
+        :return: set of nodes including the term itself
+        """
+        term = URIRef(GUFO + name)
+        # precomputed closure is valid, while all base statements are read through
+        complete = self._vocabulary and self._data.complete
+        seeds = self._vocabulary.closure(predicate, term) if complete else {term}
         results = set()
-        for subj in self._data.transitive_subjects(
-                URIRef('http://www.w3.org/2000/01/rdf-schema#subClassOf'),
-                URIRef('http://purl.org/nemo/gufo#Relator')):
-            results.add(subj)
+        # nodes already visited from other seeds are not traversed again
+        remember = dict()
+        for seed in seeds:
+            results.update(self._data.transitive_subjects(predicate, seed, remember))
         return results
 
+    def _get_relators(self) -> set:
+        return self._transitive_subjects(RDFS.subClassOf, 'Relator')
+
     def _get_endurants(self) -> (dict, dict):
         sortals = dict()
         nonsortals = dict()
+        from colour import Color
         colors = list(Color(COLOUR_ENDURANT1).range_to(Color(COLOUR_ENDURANT2), 4))
         for sortal_name, n in zip(['Kind', 'SubKind', 'Phase', 'Role'],
                                     [0, 1, 1, 2]):
-            for subj in self._data.transitive_subjects(
-                    URIRef('http://www.w3.org/1999/02/22-rdf-syntax-ns#type'),
-                    URIRef('http://purl.org/nemo/gufo#' + sortal_name)):
+            for subj in self._transitive_subjects(RDF.type, sortal_name):
                 if subj not in self._relators:
                     sortals[subj] = str(colors[n])
             for nonsortal_name in ['Category', 'RoleMixin', 'PhaseMixin', 'Mixin']:
-                for subj in self._data.transitive_subjects(
-                        URIRef('http://www.w3.org/1999/02/22-rdf-syntax-ns#type'),
-                        URIRef('http://purl.org/nemo/gufo#' + nonsortal_name)):
+                for subj in self._transitive_subjects(RDF.type, nonsortal_name):
                     if subj not in self._relators:
                         nonsortals[subj] = str(colors[3])
         return sortals, nonsortals
 
+    def _get_restrictions(self, data: RDFGraph = None) -> dict:
+        """
+        Indexes superclasses, which restrict the classes with owl:onClass or owl:someValuesFrom
+        :param data: RDFGraph object to index, the graph itself if None
+        :return: dictionary {class -> [Restriction]}, restrictions are in the order of the graph
+        """
+        data = self._data if data is None else data
+        result = dict()
+        for cls in set(data.subjects(RDFS.subClassOf, None)):
+            for (_, _, node) in data.triples((cls, RDFS.subClassOf, None)):
+                restriction = self._get_restriction(node, data)
+                if restriction:
+                    if cls not in result:
+                        result[cls] = []
+                    result[cls].append(restriction)
+        return result
+
+    def _get_restriction(self, node, data: RDFGraph):
+        """
+        Reads the restriction
+        :param node: superclass of some class
+        :param data: RDFGraph object the node belongs to
+        :return: Restriction or None if nothing is restricted
+        """
+        fillers = list(data.objects(node, OWL.onClass))
+        fillers.extend(data.objects(node, OWL.someValuesFrom))
+        if not fillers:
+            return None
+        prop = next(data.objects(node, OWL.onProperty), None)
+        inverse = (prop is not None) and (type(prop) is not URIRef)
+        if inverse:
+            # [ owl:inverseOf gufo:mediates ]
+            prop = next(data.objects(prop, OWL.inverseOf), None)
+        cardinalities = tuple((cardinality, value) for cardinality in self.CARDINALITIES
+                              for value in data.objects(node, cardinality))
+        typed = (node, RDF.type, OWL.Restriction) in data
+        return Restriction(node, prop, inverse, tuple(fillers), cardinalities, typed)
+
+    def restriction_records(self, data: RDFGraph = None) -> dict:
+        """
+        Describes restrictions of the classes regardless of their blank nodes,
+        so restrictions of different uploads can be compared
+        :param data: parsed RDFGraph object, the graph itself if None
+        :return: dictionary {class -> Counter of Restriction without node}
+        """
+        restrictions = self._restrictions if data is None else self._get_restrictions(data)
+        return {cls: Counter(restriction._replace(node=None) for restriction in items)
+                for cls, items in restrictions.items()}
+
     ##############################################
     # Used in R3-R4
     ##############################################
@@ -158,11 +348,7 @@ class Graph:
         return result
 
     def get_disjoint_by_name(self, name: str, result: dict):
-        all_disjoints = set()
-        for subj in self._data.transitive_subjects(
-                URIRef('http://www.w3.org/1999/02/22-rdf-syntax-ns#type'),
-                URIRef('http://purl.org/nemo/gufo#' + name)):
-            all_disjoints.add(subj)
+        all_disjoints = self._transitive_subjects(RDF.type, name)
         for subj in all_disjoints:
             for specific, _, general in self._data.triples((subj, RDFS.subClassOf, None)):
                 if general not in result:
@@ -181,6 +367,9 @@ class Graph:
         :param excluded: list of excluded prefixes, that should be collapsed
         :return: json-like graph structure
         """
+        # networkx is heavy and needed for visualization only
+        from rdflib.extras.external_graph_libs import rdflib_to_networkx_digraph
+        from networkx.readwrite import json_graph
         try:
             g = rdflib_to_networkx_digraph(self._data)
         except:
@@ -454,13 +643,13 @@ class Graph:
         :param node: node for processing
         :param links: processed list of links
         """
+        restrictions = {restriction.node: restriction for restriction in self._restrictions.get(node['id'], [])}
         for n in node['rdfs:subClassOf']:
             bnode = nodes_dict[n]
-            if self._is_restriction(bnode):
-                prop = bnode['owl:onProperty'][0]
-                label = prop if type(prop) is URIRef else nodes_dict[prop]['owl:inverseOf'][0]
-                label, _ = self.reduce_prefix(label)
-                target = bnode['owl:onClass'][0] if 'owl:onClass' in bnode else bnode['owl:someValuesFrom'][0]
+            restriction = restrictions.get(n)
+            if self._is_restriction(restriction):
+                label, _ = self.reduce_prefix(restriction.property)
+                target = restriction.fillers[0]
                 links.append(self._create_link(
                     nodes_dict, node['id'], target, label, **self._other_properties(bnode)
                 ))
@@ -470,28 +659,49 @@ class Graph:
                 ))
         del node['rdfs:subClassOf']
 
-    def _is_restriction(self, node) -> bool:
-        """
-        Checks if node is an owl:Restriction type
-        :param node: bnode for checking
-        :return: True is in ancestors is owl:Restriction
-        """
-        if 'rdf:type' in node:
-            for ancestor in node['rdf:type']:
-                if self.reduce_prefix(ancestor)[0] == 'owl:Restriction':
-                    if (('owl:onClass' in node) or ('owl:someValuesFrom' in node)) and \
-                            ('owl:onProperty' in node):
-                        return True
-        if ANCESTOR_NAME in node:
-            for ancestor in node[ANCESTOR_NAME]:
-                if ancestor == 'owl:Restriction':
-                    if (('owl:onClass' in node) or ('owl:someValuesFrom' in node)) and \
-                            ('owl:onProperty' in node):
-                        return True
-        return False
+    def _is_restriction(self, restriction) -> bool:
+        """
+        Checks if restriction can be shown as a link
+        :param restriction: Restriction or None
+        :return: True if it is an owl:Restriction on a property
+        """
+        return self._owl_bound and (restriction is not None) and restriction.typed and \
+            (restriction.property is not None)
 
     ##############################################
     # PART 3: Graph's description generation
+    def summarize(self) -> dict:
+        """
+        Describes the graph without visualizing it
+        :return: dictionary with statistics
+        """
+        description = self._description.copy()
+        description['num_statements'] = len(self._data)
+        description['num_relators'] = len(self._relators)
+        description['num_sortals'] = len(self._sortals)
+        description['num_nonsortals'] = len(self._nonsortals)
+        description['num_endurants'] = len(self._sortals) + len(self._nonsortals)
+        return description
+
+    def memory(self, seen: set = None) -> dict:
+        """
+        Estimates memory used by the graph
+        :param seen: ids of objects already counted, they are skipped and updated
+        :return: dictionary with number of statements and sizes in bytes
+        """
+        seen = set() if seen is None else seen
+        terms = set()
+        for triple in self._data:
+            terms.update(triple)
+        result = {'statements': len(self._data),
+                  'terms': sum(deep_size(term, seen) for term in terms),
+                  # what is left in the store after terms are its indexes
+                  'indexes': deep_size(self._data.store, seen),
+                  'classification': deep_size([self._relators, self._sortals, self._nonsortals,
+                                               self._restrictions, self._bind, self._description], seen)}
+        result['total'] = result['terms'] + result['indexes'] + result['classification']
+        return result
+
     def _make_description(self, description, n_statements, n_nodes, n_links):
         description['num_relators'] = len(self._relators)
         description['num_endurants'] = len(self._sortals) + len(self._nonsortals)
@@ -0,0 +1,121 @@
+from csum import LAYOUT_ITERATIONS, LAYOUT_DISTANCE
+
+# rows of the distance matrix computed at once, limits memory for large graphs
+BLOCK = 1024
+# pull towards the centre, keeps disconnected parts together
+GRAVITY = 0.05
+
+
+def force_layout(nodes: list, links: list, seeds: dict = None,
+                 iterations: int = LAYOUT_ITERATIONS, distance: float = LAYOUT_DISTANCE,
+                 seed: int = 0) -> dict:
+    """
+    Places nodes by Fruchterman-Reingold force-directed algorithm,
+    nodes with known positions (e.g. from the previous level) start there and move less
+    :param nodes: list of nodes with ids
+    :param links: list of links with sources and targets
+    :param seeds: dictionary node id -> [x, y]
+    :param iterations: number of iterations
+    :param distance: optimal distance between linked nodes
+    :param seed: seed of the random generator
+    :return: dictionary node id -> [x, y]
+    """
+    import numpy as np
+    ids = [node['id'] for node in nodes]
+    if not ids:
+        return dict()
+    index = {node_id: i for i, node_id in enumerate(ids)}
+    n = len(ids)
+    edges = np.array([(index[link['source']], index[link['target']]) for link in links
+                      if (link['source'] in index) and (link['target'] in index)
+                      and (link['source'] != link['target'])], dtype=int).reshape(-1, 2)
+
+    size = distance * np.sqrt(n)
+    positions = np.random.RandomState(seed).uniform(-size / 2, size / 2, (n, 2))
+    known = np.zeros(n, dtype=bool)
+    for node_id, position in (seeds or dict()).items():
+        if node_id in index:
+            positions[index[node_id]] = position
+            known[index[node_id]] = True
+    if known.any():
+        _place_unknown(positions, known, edges, distance)
+        # the picture should stay as it was, so nodes are only adjusted
+        temperature = distance / 4
+    else:
+        temperature = size / 10
+
+    for i in range(iterations):
+        shift = _repulsion(positions, distance)
+        if len(edges):
+            delta = positions[edges[:, 0]] - positions[edges[:, 1]]
+            length = np.maximum(np.linalg.norm(delta, axis=1), 0.01)
+            force = delta * (length / distance)[:, None]
+            np.add.at(shift, edges[:, 0], -force)
+            np.add.at(shift, edges[:, 1], force)
+        shift -= GRAVITY * positions
+        length = np.maximum(np.linalg.norm(shift, axis=1), 0.01)
+        # cooling: nodes move less and less
+        step = temperature * (1 - i / iterations)
+        positions += shift * (np.minimum(length, step) / length)[:, None]
+
+    if not known.any():
+        positions -= positions.mean(axis=0)
+    return {node_id: [round(float(x), 2), round(float(y), 2)] for node_id, (x, y) in zip(ids, positions)}
+
+
+def _repulsion(positions, distance: float):
+    """
+    Repulsive forces between all pairs of nodes, computed by blocks of rows
+    :return: array of shifts
+    """
+    import numpy as np
+    shift = np.zeros_like(positions)
+    x, y = positions[:, 0], positions[:, 1]
+    for start in range(0, len(positions), BLOCK):
+        dx = x[start:start + BLOCK, None] - x[None, :]
+        dy = y[start:start + BLOCK, None] - y[None, :]
+        weight = distance ** 2 / np.maximum(dx * dx + dy * dy, 0.0001)
+        shift[start:start + BLOCK, 0] = (dx * weight).sum(axis=1)
+        shift[start:start + BLOCK, 1] = (dy * weight).sum(axis=1)
+    return shift
+
+
+def _place_unknown(positions, known, edges, distance: float):
+    """
+    Moves nodes without positions next to their placed neighbours
+    """
+    import numpy as np
+    placed = known.copy()
+    for _ in range(len(positions)):
+        if placed.all() or not len(edges):
+            return
+        total = np.zeros_like(positions)
+        count = np.zeros(len(positions))
+        for a, b in ((0, 1), (1, 0)):
+            sources = edges[placed[edges[:, a]] & ~placed[edges[:, b]]]
+            np.add.at(total, sources[:, b], positions[sources[:, a]])
+            np.add.at(count, sources[:, b], 1)
+        new = count > 0
+        if not new.any():
+            return
+        jitter = np.random.RandomState(len(positions)).uniform(-distance / 2, distance / 2, (new.sum(), 2))
+        positions[new] = total[new] / count[new][:, None] + jitter
+        placed |= new
+
+
+def place(view: dict, positions: dict) -> dict:
+    """
+    Adds coordinates to the nodes, the visualization itself is not changed
+    :param view: json-like graph structure
+    :param positions: dictionary node id -> [x, y]
+    :return: json-like graph structure with x and y of nodes
+    """
+    nodes = []
+    for node in view['nodes']:
+        node = dict(node)
+        if node['id'] in positions:
+            node['x'], node['y'] = positions[node['id']]
+        nodes.append(node)
+    result = dict(view)
+    result['nodes'] = nodes
+    return result
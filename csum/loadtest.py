@@ -0,0 +1,250 @@
+"""
+Load generator replaying modelers' sessions against csum API:
+each virtual user uploads an ontology and zooms in and out with /plus, /minus and /level.
+Usage: python -m csum.loadtest --users 8 --iterations 5 [--ttl model.ttl] [--url http://host:port]
+Without --url the server is started locally and its memory is sampled.
+"""
+import argparse
+import asyncio
+import math
+import os
+import random
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+PREFIXES = """@prefix : <http://example.org/synthetic#> .
+@prefix gufo: <http://purl.org/nemo/gufo#> .
+@prefix owl: <http://www.w3.org/2002/07/owl#> .
+@prefix rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#> .
+@prefix rdfs: <http://www.w3.org/2000/01/rdf-schema#> .
+@prefix xsd: <http://www.w3.org/2001/XMLSchema#> .
+"""
+
+
+def synthetic_ontology(n_kinds: int, seed: int = 0) -> str:
+    """
+    Generates gUFO-based model with kinds, their subkinds, phases and roles,
+    role mixins and relators mediating the roles
+    :param n_kinds: number of kinds, the model grows linearly with it
+    :param seed: seed of the random generator
+    :return: turtle text
+    """
+    rnd = random.Random(seed)
+    lines = [PREFIXES]
+
+    def restriction(on_property, on_class, cardinality):
+        return ('[ rdf:type owl:Restriction ; owl:onProperty {} ; owl:onClass :{} ; '
+                'owl:{} "1"^^xsd:nonNegativeInteger ]'.format(on_property, on_class, cardinality))
+
+    def declare(name, gufo_type, *ancestors):
+        lines.append(':{} rdf:type owl:Class, gufo:{} ; rdfs:label "{}"@en .'.format(name, gufo_type, name))
+        for ancestor in ancestors:
+            lines.append(':{} rdfs:subClassOf {} .'.format(name, ancestor))
+
+    roles = []
+    for k in range(n_kinds):
+        kind = 'Kind{}'.format(k)
+        declare(kind, 'Kind', 'gufo:FunctionalComplex')
+        lines.append(':has{0} rdf:type owl:DatatypeProperty ; rdfs:domain :{0} ; rdfs:range xsd:string .'.format(kind))
+        for s in range(2):
+            declare('{}SubKind{}'.format(kind, s), 'SubKind', ':' + kind)
+        for p in range(2):
+            declare('{}Phase{}'.format(kind, p), 'Phase', ':' + kind)
+        role = '{}Role'.format(kind)
+        declare(role, 'Role', ':{}Phase0'.format(kind))
+        roles.append(role)
+    mixins = []
+    for m in range(max(n_kinds // 3, 1)):
+        mixin = 'RoleMixin{}'.format(m)
+        declare(mixin, 'RoleMixin')
+        mixins.append(mixin)
+        for role in rnd.sample(roles, min(2, len(roles))):
+            lines.append(':{} rdfs:subClassOf :{} .'.format(role, mixin))
+    for r in range(max(n_kinds // 2, 1)):
+        relator = 'Relator{}'.format(r)
+        declare(relator, 'Kind', 'gufo:Relator')
+        for mediated in rnd.sample(roles + mixins, min(2, len(roles + mixins))):
+            lines.append(':{} rdfs:subClassOf {} .'.format(
+                relator, restriction('gufo:mediates', mediated, 'qualifiedCardinality')))
+            lines.append(':{} rdfs:subClassOf {} .'.format(
+                mediated, restriction('[ owl:inverseOf gufo:mediates ]', relator, 'minQualifiedCardinality')))
+    for role in roles:
+        target = rnd.choice(roles)
+        lines.append(':{0}Relation rdf:type owl:ObjectProperty ; rdfs:domain :{0} ; rdfs:range :{1} .'.format(
+            role, target))
+    return '\n'.join(lines) + '\n'
+
+
+def percentile(values: list, q: float) -> float:
+    """
+    Nearest-rank percentile
+    :param values: sorted list of values
+    :param q: percentile from 0 to 100
+    :return: value of the percentile
+    """
+    if not values:
+        return 0.0
+    rank = max(math.ceil(q / 100 * len(values)) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+
+def server_memory(pid: int) -> int:
+    """
+    Resident memory of the process and its children, e.g. uvicorn workers
+    :param pid: process id of the server
+    :return: memory in bytes, 0 if not available
+    """
+    total = 0
+    pids = [pid]
+    try:
+        with open('/proc/{0}/task/{0}/children'.format(pid)) as f:
+            pids.extend(int(child) for child in f.read().split())
+    except OSError:
+        pass
+    for p in pids:
+        try:
+            with open('/proc/{}/status'.format(p)) as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1]) * 1024
+        except OSError:
+            pass
+    return total
+
+
+class LoadTest:
+    def __init__(self, url: str, models: list, users: int, iterations: int, seed: int = 0):
+        self.url = url.rstrip('/')
+        self.models = models
+        self.users = users
+        self.iterations = iterations
+        self._random = random.Random(seed)
+        # endpoint -> list of latencies in seconds
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.memory = []
+
+    async def _call(self, client, endpoint: str, method: str, session: str, **kwargs):
+        headers = {'X-Session-Id': session}
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, self.url + endpoint, headers=headers, **kwargs)
+            failed = response.status_code >= 400
+        except Exception:
+            failed = True
+        name = endpoint.split('/')[1]
+        self.latencies[name].append(time.perf_counter() - started)
+        if failed:
+            self.errors[name] += 1
+
+    async def _user(self, client, user: int):
+        """
+        Replays session of one modeler: upload, zoom in and out, jump to a level
+        """
+        session = 'loadtest-{}'.format(user)
+        rnd = random.Random(self._random.random())
+        for _ in range(self.iterations):
+            model = rnd.choice(self.models)
+            await self._call(client, '/load_data', 'PUT', session, files={'data': ('model.ttl', model)})
+            for _ in range(rnd.randint(1, 4)):
+                await self._call(client, '/plus', 'POST', session)
+            for _ in range(rnd.randint(0, 2)):
+                await self._call(client, '/minus', 'POST', session)
+            await self._call(client, '/level/{}'.format(rnd.randint(0, 4)), 'GET', session)
+
+    async def _sample_memory(self, pid: int):
+        while True:
+            self.memory.append(server_memory(pid))
+            await asyncio.sleep(0.5)
+
+    async def run(self, pid: int = None) -> float:
+        """
+        Runs all virtual users concurrently
+        :param pid: process id of the server to sample its memory
+        :return: duration in seconds
+        """
+        import httpx
+        sampler = asyncio.ensure_future(self._sample_memory(pid)) if pid else None
+        started = time.perf_counter()
+        async with httpx.AsyncClient(timeout=None) as client:
+            await asyncio.gather(*[self._user(client, user) for user in range(self.users)])
+        duration = time.perf_counter() - started
+        if sampler:
+            sampler.cancel()
+            self.memory.append(server_memory(pid))
+        return duration
+
+    def report(self, duration: float) -> str:
+        n_requests = sum(len(values) for values in self.latencies.values())
+        n_errors = sum(self.errors.values())
+        lines = ['{} requests in {:.1f} s: {:.1f} req/s, {:.2%} errors'.format(
+                     n_requests, duration, n_requests / duration, n_errors / max(n_requests, 1)),
+                 '{:<10} {:>6} {:>9} {:>9} {:>9} {:>7}'.format('endpoint', 'count', 'p50, ms', 'p95, ms',
+                                                            'p99, ms', 'errors')]
+        for name, values in sorted(self.latencies.items()):
+            values = sorted(values)
+            lines.append('{:<10} {:>6} {:>9.1f} {:>9.1f} {:>9.1f} {:>7}'.format(
+                name, len(values), percentile(values, 50) * 1000, percentile(values, 95) * 1000,
+                percentile(values, 99) * 1000, self.errors[name]))
+        if self.memory:
+            lines.append('server memory: peak {:.1f} MB, final {:.1f} MB'.format(
+                max(self.memory) / 2 ** 20, self.memory[-1] / 2 ** 20))
+        return '\n'.join(lines)
+
+
+async def wait_for_server(url: str, timeout: float = 60):
+    import httpx
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(url + '/health')).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise TimeoutError("Server at {} is not available".format(url))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help='URL of running server, otherwise it is started locally')
+    parser.add_argument('--port', type=int, default=8765, help='port of locally started server')
+    parser.add_argument('--workers', type=int, default=1, help='workers of locally started server, more than one needs STATE_DATABASE')
+    parser.add_argument('--users', type=int, default=8, help='number of concurrent sessions')
+    parser.add_argument('--iterations', type=int, default=3, help='uploads per session')
+    parser.add_argument('--ttl', nargs='*', default=[], help='turtle files to upload')
+    parser.add_argument('--kinds', type=int, default=20, help='size of synthetic models')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    models = []
+    for path in args.ttl:
+        with open(path, 'rb') as f:
+            models.append(f.read())
+    if not models:
+        models = [synthetic_ontology(args.kinds, args.seed + i).encode() for i in range(3)]
+
+    server = None
+    url = args.url
+    if not url:
+        url = 'http://127.0.0.1:{}'.format(args.port)
+        server = subprocess.Popen([sys.executable, '-m', 'uvicorn', 'csum.main:app',
+                                   '--port', str(args.port), '--workers', str(args.workers),
+                                   '--log-level', 'warning'],
+                                  env=dict(os.environ), stdout=subprocess.DEVNULL)
+    try:
+        asyncio.run(wait_for_server(url))
+        test = LoadTest(url, models, args.users, args.iterations, args.seed)
+        duration = asyncio.run(test.run(server.pid if server else None))
+        print(test.report(duration))
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+import atexit
+import logging
+import os
+import sys
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, WatchedFileHandler
+from queue import Queue
+
+from csum import API_WORKERS, LOG_FILE, LOG_LEVEL, LOG_MAX_BYTES, LOG_BACKUPS
+
+
+def setup_custom_logger(name):
+    """
+    Creates logger, which only puts records into a queue,
+    they are formatted and written by a background thread.
+    Several workers only append to the file, as each of them would rotate it on its own,
+    so the file is to be rotated outside (e.g. by logrotate) and is reopened after that
+    :param name: name of the logger
+    :return: logger object
+    """
+    formatter = logging.Formatter(fmt='%(levelname)-8s %(asctime)s %(message)s',
+                                  datefmt='%Y-%m-%d %H:%M:%S')
+    if API_WORKERS > 1:
+        handler = WatchedFileHandler(LOG_FILE)
+    else:
+        handler = RotatingFileHandler(LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS)
+    handler.setFormatter(formatter)
+    screen_handler = logging.StreamHandler(stream=sys.stdout)
+    screen_handler.setFormatter(formatter)
+    queue = Queue(-1)
+    listener = QueueListener(queue, handler, screen_handler)
+    listener.start()
+    atexit.register(listener.stop)
+    _logger = logging.getLogger(name)
+    _logger.setLevel(LOG_LEVEL)
+    _logger.addHandler(QueueHandler(queue))
+    return _logger
+
+
+def read_log(offset: int = None, tail: int = None) -> (bytes, int):
+    """
+    Reads the new part of the log file
+    :param offset: position, the client has already read up to
+    :param tail: number of last bytes to be read
+    :return: content, position of the end of the file
+    """
+    try:
+        size = os.path.getsize(LOG_FILE)
+    except OSError:
+        return b'', 0
+    if tail is not None:
+        start = max(size - tail, 0)
+    elif offset is not None:
+        # the file was rotated, so the client reads it from the beginning
+        start = offset if offset <= size else 0
+    else:
+        start = 0
+    with open(LOG_FILE, 'rb') as f:
+        f.seek(start)
+        content = f.read(size - start)
+    return content, start + len(content)
@@ -1,31 +1,34 @@
-import uvicorn
-import logging
-import sys
+import hmac
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
 
-from fastapi import FastAPI, File, UploadFile, HTTPException
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi import FastAPI, File, UploadFile, HTTPException, Header, Depends, Query, Request
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
 from starlette.middleware.cors import CORSMiddleware
 
-from csum import API_PORT, LOG_FILE, SHOW_ORIGIN, EXCLUDED_PREFIX
+from csum import API_PORT, API_WORKERS, LOG_FILE, SHOW_ORIGIN, EXCLUDED_PREFIX, \
+    PRECOMPUTE_LEVELS, PRECOMPUTE_WORKERS, BASE_VOCABULARIES, STATE_DATABASE, \
+    TRACE_ALLOCATIONS, TRACE_FRAMES, TRACE_TOP, ADMIN_TOKEN
+from csum import columnar, ndjson
+from csum.logs import setup_custom_logger, read_log
+from csum.memory import Tracer, TracemallocTracer, interpreter
 from csum.meta import MetaGraph
-
-
-def setup_custom_logger(name):
-    formatter = logging.Formatter(fmt='%(levelname)-8s %(asctime)s %(message)s',
-                                  datefmt='%Y-%m-5d %H:%M:%S')
-    handler = logging.FileHandler(LOG_FILE, mode='w+')
-    handler.setFormatter(formatter)
-    screen_handler = logging.StreamHandler(stream=sys.stdout)
-    screen_handler.setFormatter(formatter)
-    _logger = logging.getLogger(name)
-    _logger.setLevel(logging.INFO)
-    _logger.addHandler(handler)
-    _logger.addHandler(screen_handler)
-    return _logger
+from csum.profiling import Profiles
+from csum.progress import server_sent_events
+from csum.render import FORMATS, Renderer
+from csum.sessions import Sessions
+from csum.state import StateBackend, SQLiteBackend
+from csum.vocabulary import Vocabulary
 
 
 logger = setup_custom_logger('csum')
-graph = MetaGraph(logger)
+executor = ThreadPoolExecutor(max_workers=PRECOMPUTE_WORKERS) if PRECOMPUTE_LEVELS else None
+vocabulary = Vocabulary(logger, BASE_VOCABULARIES) if BASE_VOCABULARIES else None
+backend = SQLiteBackend(STATE_DATABASE) if STATE_DATABASE else StateBackend()
+tracer = TracemallocTracer(logger, TRACE_FRAMES, TRACE_TOP) if TRACE_ALLOCATIONS else Tracer()
+sessions = Sessions(logger, executor, vocabulary, backend, tracer=tracer)
+renderer = Renderer(logger)
+profiles = Profiles(logger)
 
 app = FastAPI()
 app.add_middleware(
@@ -38,8 +41,12 @@ app.add_middleware(
 
 
 @app.get('/get_log')
-async def get_log():
-    return FileResponse(LOG_FILE)
+def get_log(offset: int = Query(None, ge=0), tail: int = Query(None, ge=0)):
+    if (offset is None) and (tail is None):
+        return FileResponse(LOG_FILE)
+    content, position = read_log(offset, tail)
+    return Response(content=content, media_type='text/plain',
+                    headers={'X-Log-Offset': str(position)})
 
 
 @app.get('/health')
@@ -47,38 +54,237 @@ async def health():
     return {'status': 'success'}
 
 
+def get_graph(x_session_id: str = Header(Sessions.DEFAULT)) -> MetaGraph:
+    graph = sessions.get(x_session_id)
+    if graph is None:
+        logger.warning('No session {}. Use /load_data first'.format(x_session_id))
+        raise HTTPException(status_code=428, detail='No data loaded')
+    return graph
+
+
+def create_graph(x_session_id: str = Header(Sessions.DEFAULT)):
+    # the session is kept until the upload is answered
+    with sessions.upload(x_session_id) as graph:
+        if graph is None:
+            raise HTTPException(status_code=503, detail='Too many sessions')
+        yield graph
+
+
+def check_admin(x_admin_token: str = Header(None)):
+    if not ADMIN_TOKEN or not hmac.compare_digest((x_admin_token or '').encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail='Admin token is required')
+
+
+def get_profile(profile: bool = False, x_admin_token: str = Header(None)) -> bool:
+    if profile:
+        check_admin(x_admin_token)
+    return profile
+
+
+def profiled(name: str, profile: bool, function):
+    """
+    Runs the work of the request, profiles it if asked
+    :param name: name of the request
+    :param profile: if True, profile is stored and its id is returned in X-Profile header,
+    409 is returned if another request is being profiled
+    :param function: function, that returns the response
+    :return: response
+    """
+    if not profile:
+        return function()
+    with profiles.profile(name) as report:
+        if report is None:
+            raise HTTPException(status_code=409, detail='Another request is being profiled')
+        response = function()
+        response.headers['X-Profile'] = report.id
+    return response
+
+
 @app.put('/load_data', response_class=JSONResponse)
-async def load_data(original: bool = SHOW_ORIGIN,
-                    excluded: str = None,
-                    data: UploadFile = File(...)):
+def load_data(original: bool = SHOW_ORIGIN,
+              excluded: str = None,
+              data: UploadFile = File(...),
+              layout: bool = False,
+              accept: str = Header(None),
+              profile: bool = Depends(get_profile),
+              graph: MetaGraph = Depends(create_graph)):
     excluded = excluded.split(',') if excluded else EXCLUDED_PREFIX
-    if graph.load_data(data.file, original, excluded):
-        graph_json = graph.visualize()
+    return profiled('load_data', profile,
+                    partial(load, graph, data.file, original, excluded, layout, accept))
+
+
+def load(graph, data, original: bool, excluded: list, layout: bool, accept: str = None):
+    if graph.load_data(data, original, excluded):
+        graph_json = graph.visualize(layout)
         if graph_json:
-            return JSONResponse(content=graph_json)
+            return respond(graph_json, accept, progress=graph.progress)
     return JSONResponse(content={'Error': 'Not able to parse the graph'},
                         status_code=400)
 
 
-def apply_meta(function_name):
-    if not graph.data:
+def representation(accept: str = None) -> str:
+    if ndjson.accepts(accept):
+        return 'ndjson'
+    return 'columnar' if columnar.accepts(accept) else 'json'
+
+
+def respond(graph_json, accept: str = None, headers: dict = None, progress=None):
+    fmt = representation(accept)
+    if fmt == 'ndjson':
+        # nodes and links are sent as soon as they are encoded
+        return StreamingResponse(ndjson.encode(graph_json, progress), media_type=ndjson.MEDIA_TYPE,
+                                 headers=headers)
+    if progress is None:
+        return encode(graph_json, fmt, headers)
+    with progress.stage('encoding', format=fmt) as result:
+        response = encode(graph_json, fmt, headers)
+        result['bytes'] = len(response.body)
+    return response
+
+
+def encode(graph_json, fmt: str, headers: dict = None):
+    if fmt == 'columnar':
+        return Response(content=columnar.encode(graph_json), media_type=columnar.MEDIA_TYPE,
+                        headers=headers)
+    return JSONResponse(content=graph_json, headers=headers)
+
+
+def apply_meta(graph, function_name, accept: str = None):
+    if not graph.loaded():
         logger.warning('No data for processing. Use /load_data first')
         raise HTTPException(status_code=428, detail='No data loaded')
     graph_json = function_name()
     if graph_json:
-        return JSONResponse(content=graph_json)
+        return respond(graph_json, accept, progress=graph.progress)
     return JSONResponse(content={'Error': 'Not able to parse the graph'},
                         status_code=400)
 
 
 @app.post('/plus', response_class=JSONResponse)
-async def plus():
-    return apply_meta(graph.plus)
+def plus(layout: bool = False, accept: str = Header(None), profile: bool = Depends(get_profile),
+         graph: MetaGraph = Depends(get_graph)):
+    return profiled('plus', profile, partial(apply_meta, graph, partial(graph.plus, layout), accept))
 
 
 @app.post('/minus', response_class=JSONResponse)
-async def minus():
-    return apply_meta(graph.minus)
+def minus(layout: bool = False, accept: str = Header(None), profile: bool = Depends(get_profile),
+          graph: MetaGraph = Depends(get_graph)):
+    return profiled('minus', profile, partial(apply_meta, graph, partial(graph.minus, layout), accept))
+
+
+@app.get('/level/{level}', response_class=JSONResponse)
+def level(level: int, layout: bool = False, accept: str = Header(None),
+          profile: bool = Depends(get_profile), graph: MetaGraph = Depends(get_graph)):
+    if not 0 <= level <= MetaGraph.MAX_LEVEL:
+        raise HTTPException(status_code=404, detail='No such level')
+    return profiled('level', profile, partial(apply_meta, graph, partial(graph.level, level, layout), accept))
+
+
+def matches(if_none_match: str, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(',')]
+    # weak comparison is used for conditional GET
+    return any((tag == '*') or (tag[2:] if tag.startswith('W/') else tag) == etag for tag in tags)
+
+
+def conditional_view(graph, level: int = None, layout: bool = False, accept: str = None,
+                     if_none_match: str = None):
+    if not graph.loaded():
+        logger.warning('No data for processing. Use /load_data first')
+        raise HTTPException(status_code=428, detail='No data loaded')
+    graph_json, etag = graph.view(level, layout)
+    if not graph_json:
+        return JSONResponse(content={'Error': 'Not able to parse the graph'},
+                            status_code=400)
+    # representations differ in the format, so do their tags
+    fmt = representation(accept)
+    etag = '"{}{}"'.format(etag, '' if fmt == 'json' else '-' + fmt)
+    headers = {'ETag': etag, 'Cache-Control': 'no-cache', 'Vary': 'Accept, X-Session-Id'}
+    if matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return respond(graph_json, accept, headers, graph.progress)
+
+
+@app.get('/view', response_class=JSONResponse)
+def view(layout: bool = False, accept: str = Header(None), if_none_match: str = Header(None),
+         profile: bool = Depends(get_profile), graph: MetaGraph = Depends(get_graph)):
+    return profiled('view', profile, partial(conditional_view, graph, None, layout, accept, if_none_match))
+
+
+@app.get('/view/{level}', response_class=JSONResponse)
+def view_level(level: int, layout: bool = False, accept: str = Header(None),
+               if_none_match: str = Header(None), profile: bool = Depends(get_profile),
+               graph: MetaGraph = Depends(get_graph)):
+    if not 0 <= level <= MetaGraph.MAX_LEVEL:
+        raise HTTPException(status_code=404, detail='No such level')
+    return profiled('view', profile, partial(conditional_view, graph, level, layout, accept, if_none_match))
+
+
+@app.get('/export/{level}')
+def export(level: int, fmt: str = Query('svg', alias='format'), if_none_match: str = Header(None),
+           graph: MetaGraph = Depends(get_graph)):
+    if not 0 <= level <= MetaGraph.MAX_LEVEL:
+        raise HTTPException(status_code=404, detail='No such level')
+    if fmt not in FORMATS:
+        raise HTTPException(status_code=400, detail='Format should be one of: ' + ', '.join(FORMATS))
+    if not graph.loaded():
+        logger.warning('No data for processing. Use /load_data first')
+        raise HTTPException(status_code=428, detail='No data loaded')
+    graph_json, etag = graph.view(level)
+    if not graph_json:
+        return JSONResponse(content={'Error': 'Not able to parse the graph'},
+                            status_code=400)
+    headers = {'ETag': '"{}-{}"'.format(etag, fmt), 'Cache-Control': 'no-cache', 'Vary': 'X-Session-Id'}
+    if matches(if_none_match, headers['ETag']):
+        return Response(status_code=304, headers=headers)
+    try:
+        content = renderer.render(etag, graph_json, fmt).result()
+    except:
+        return JSONResponse(content={'Error': 'Not able to render the graph'},
+                            status_code=500)
+    return Response(content=content, media_type=FORMATS[fmt], headers=headers)
+
+
+@app.get('/levels', response_class=JSONResponse)
+def levels(accept: str = Header(None), profile: bool = Depends(get_profile),
+           graph: MetaGraph = Depends(get_graph)):
+    # statistics are not a visualization, so they are not packed into columns
+    accept = accept if ndjson.accepts(accept) else None
+    return profiled('levels', profile, partial(apply_meta, graph, graph.levels, accept))
+
+
+@app.get('/progress')
+async def progress(request: Request, session: str = None, x_session_id: str = Header(Sessions.DEFAULT)):
+    # EventSource cannot set headers, so the session can be given as a parameter,
+    # it can be subscribed before the first upload
+    progress = sessions.progress(session or x_session_id)
+    return StreamingResponse(server_sent_events(progress, request), media_type='text/event-stream',
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@app.get('/memory', dependencies=[Depends(check_admin)])
+def memory(graph: MetaGraph = Depends(get_graph)):
+    return {'levels': graph.memory(),
+            'interpreter': interpreter(),
+            'allocations': tracer.report()}
+
+
+@app.get('/profiles', dependencies=[Depends(check_admin)])
+def list_profiles():
+    return profiles.list()
+
+
+@app.get('/profiles/{profile_id}', dependencies=[Depends(check_admin)])
+def profile_report(profile_id: str, raw: bool = False):
+    profile = profiles.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail='No such profile')
+    if raw:
+        # can be opened by pstats or snakeviz
+        return Response(content=profile.dump(), media_type='application/octet-stream',
+                        headers={'Content-Disposition': 'attachment; filename="{}.prof"'.format(profile_id)})
+    return Response(content=profile.report(), media_type='text/plain')
 
 """
 @app.post('/unfold', response_class=JSONResponse)
@@ -87,4 +293,5 @@ async def unfold():
 """
 
 if __name__ == "__main__":
-    uvicorn.run(app, port=API_PORT, host='0.0.0.0')
+    import uvicorn
+    uvicorn.run('csum.main:app', port=API_PORT, host='0.0.0.0', workers=API_WORKERS)
@@ -0,0 +1,126 @@
+import gc
+import sys
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from types import BuiltinFunctionType, FunctionType, MethodType, ModuleType
+
+# objects shared by everybody, they are not counted as a part of any graph
+_SHARED = (type, ModuleType, FunctionType, BuiltinFunctionType, MethodType)
+
+
+def deep_size(obj, seen: set = None) -> int:
+    """
+    Estimates memory used by the object and everything it refers to
+    :param obj: any object
+    :param seen: ids of objects already counted, they are skipped and updated
+    :return: size in bytes
+    """
+    seen = set() if seen is None else seen
+    size = 0
+    stack = [obj]
+    while stack:
+        current = stack.pop()
+        if (id(current) in seen) or isinstance(current, _SHARED):
+            continue
+        seen.add(id(current))
+        size += sys.getsizeof(current)
+        if isinstance(current, dict):
+            stack.extend(current.keys())
+            stack.extend(current.values())
+        elif isinstance(current, (list, tuple, set, frozenset)):
+            stack.extend(current)
+        if hasattr(current, '__dict__'):
+            stack.append(vars(current))
+        # rdflib's terms are strings with slots, e.g. language of literals
+        for cls in type(current).__mro__:
+            for name in getattr(cls, '__slots__', ()):
+                if hasattr(current, name) and not name.startswith('__'):
+                    stack.append(getattr(current, name))
+    return size
+
+
+def interpreter() -> dict:
+    """
+    Memory of the whole process
+    :return: dictionary with resident memory, its peak, number of objects and gc counters
+    """
+    result = {'rss': 0, 'peak_rss': 0}
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    result['rss'] = int(line.split()[1]) * 1024
+                elif line.startswith('VmHWM:'):
+                    result['peak_rss'] = int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    result['objects'] = len(gc.get_objects())
+    result['gc_counts'] = list(gc.get_count())
+    if tracemalloc.is_tracing():
+        result['traced'], result['peak_traced'] = tracemalloc.get_traced_memory()
+    return result
+
+
+class Tracer:
+    """
+    Tracer of allocations made by the operations on graphs.
+    This one traces nothing
+    """
+    TRACING = False
+
+    @contextmanager
+    def track(self, operation: str):
+        """
+        Traces allocations made inside the block
+        :param operation: name of the operation, e.g. load_data
+        """
+        yield
+
+    def report(self) -> dict:
+        """
+        :return: dictionary operation -> top allocation sites of its last run
+        """
+        return dict()
+
+
+class TracemallocTracer(Tracer):
+    """
+    Compares tracemalloc snapshots taken before and after the operation.
+    Tracing is process-wide, so allocations of concurrent requests are mixed in
+    """
+    TRACING = True
+
+    def __init__(self, logger, frames: int = 1, top: int = 10):
+        self.logger = logger
+        self._top = top
+        self._reports = dict()
+        self._lock = threading.Lock()
+        self._filters = [tracemalloc.Filter(False, tracemalloc.__file__)]
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        self.logger.info("Allocations are traced with {} frames".format(tracemalloc.get_traceback_limit()))
+
+    @contextmanager
+    def track(self, operation: str):
+        before = tracemalloc.take_snapshot().filter_traces(self._filters)
+        try:
+            yield
+        finally:
+            after = tracemalloc.take_snapshot().filter_traces(self._filters)
+            statistics = after.compare_to(before, 'lineno')
+            report = {'size_diff': sum(stat.size_diff for stat in statistics),
+                      'sites': [self._site(stat) for stat in statistics[:self._top]]}
+            with self._lock:
+                self._reports[operation] = report
+
+    @staticmethod
+    def _site(stat) -> dict:
+        frame = stat.traceback[0]
+        return {'file': frame.filename, 'line': frame.lineno,
+                'size': stat.size, 'size_diff': stat.size_diff,
+                'count': stat.count, 'count_diff': stat.count_diff}
+
+    def report(self) -> dict:
+        with self._lock:
+            return dict(self._reports)
@@ -1,54 +1,558 @@
 import copy
+import hashlib
+import json
+import threading
+from uuid import uuid4
+from concurrent.futures import CancelledError, Future, wait
+from functools import partial
 
+from csum import REVISION_SIMILARITY
 from csum.graph import Graph
+from csum.layout import force_layout, place
+from csum.memory import Tracer, deep_size
+from csum.progress import Progress
 from csum.raplicator import RApplicator
+from csum.revision import Revision
+from csum.state import StateBackend
 
 
 class MetaGraph:
-    def __init__(self, logger):
+    MAX_LEVEL = 4
+
+    def __init__(self, logger, executor=None, vocabulary=None, backend=None, session='default', tracer=None,
+                 progress=None):
         self.logger = logger
+        self._vocabulary = vocabulary
+        # state shared with other workers, version identifies the loaded graph
+        self._backend = backend or StateBackend()
+        self._session = session
+        # tracer of allocations, traces nothing by default
+        self._tracer = tracer or Tracer()
+        self._version = None
         self.data = None
         self._state = 0
         self._original = False
         self._excluded = []
-        self._rules_applicator = RApplicator(logger)
+        # stages of long operations, published to the subscribed clients
+        self.progress = progress or Progress()
+        self._rules_applicator = RApplicator(logger, self.progress)
+        self._rules = {1: self._rules_applicator.apply_r1,
+                       2: self._rules_applicator.apply_r2,
+                       3: self._rules_applicator.apply_r3,
+                       4: self._rules_applicator.apply_r4}
+        # level -> cached visualization
+        self._views = dict()
+        # level -> (coordinates of nodes, their hash)
+        self._layouts = dict()
+        # level -> (visualization, its entity tag)
+        self._etags = dict()
+        # pool for precomputation of levels after load, disabled if None
+        self._executor = executor
+        self._precomputation = None
+        # upload counter, computations of previous uploads are discarded
+        self._generation = 0
+        # (cache name, level) -> future of the running computation
+        self._inflight = dict()
+        self._updating = False
+        self._lock = threading.Condition()
+        # generation of the computation running in the current thread
+        self._local = threading.local()
+        # serializes changes of the state, key -> future of the running change
+        self._transitions = threading.Lock()
+        self._operations = dict()
 
     def load_data(self, graph_data, original: bool, excluded: list):
-        graph = Graph(self.logger)
-        if graph.load_data(graph_data):
-            self.data = {0: graph}
-            self._state = 0
-            self._original = original
-            self._excluded = excluded
-            return True
-        return False
-
-    def visualize(self):
+        with self._tracer.track('load_data'), self.progress.operation('load_data'):
+            return self._load_data(graph_data, original, excluded)
+
+    def _load_data(self, graph_data, original: bool, excluded: list):
+        graph = Graph(self.logger, self._vocabulary)
+        with self.progress.stage('parsing') as result:
+            new_data = graph.parse_data(graph_data)
+            result['statements'] = len(new_data) if new_data is not None else 0
+        if new_data is None:
+            return False
+        # compared without blocking other operations of the session
+        revision, generation = self._compare(new_data)
+        with self._transitions:
+            self._sync()
+            if generation != self._generation:
+                # loaded graph was replaced or revised meanwhile
+                revision = Revision(self.data[0], new_data, REVISION_SIMILARITY) if self.data else None
+            self._begin_update()
+            try:
+                if (original != self._original) or (excluded != self._excluded):
+                    self._views = dict()
+                    self._layouts = dict()
+                self._original = original
+                self._excluded = excluded
+                if revision and revision.is_revision:
+                    self._revise(revision)
+                else:
+                    with self.progress.stage('classification') as result:
+                        graph.set_data(new_data)
+                        result.update(relators=len(graph.relators), endurants=len(graph.endurants))
+                    self.data = {0: graph}
+                    self._views = dict()
+                    self._layouts = dict()
+                # every upload starts from level 0, kept levels only make zooming faster
+                self._state = 0
+                self._version = uuid4().hex
+            finally:
+                self._end_update()
+            self._publish()
+        self._start_precomputation()
+        return True
+
+    def _compare(self, new_data) -> (Revision, int):
+        """
+        Compares the upload with the loaded graph
+        :param new_data: parsed RDFGraph object
+        :return: Revision or None if nothing is loaded, number of upload it is made for
+        """
+        with self._lock:
+            while self._updating:
+                self._lock.wait()
+            generation = self._generation
+            base = self.data[0] if self.data else None
+        if base is None:
+            return None, generation
+        try:
+            return Revision(base, new_data, REVISION_SIMILARITY), generation
+        except RuntimeError:
+            # graph is revised in place by another upload
+            return None, None
+
+    def loaded(self) -> bool:
+        """
+        Checks if there is a graph to process, does not wait for running transitions,
+        as they catch up with other workers themselves
+        :return: True if a graph is loaded
+        """
+        if not self.data:
+            # the graph could be uploaded to another worker
+            with self._transitions:
+                self._sync()
+        return bool(self.data)
+
+    def _sync(self):
+        """
+        Catches up with the graph and the state changed by other workers
+        """
+        meta = self._backend.meta(self._session)
+        if meta is None:
+            return
+        if meta['version'] != self._version:
+            record = self._backend.graph(self._session, meta['version'])
+            if record is None:
+                return
+            self.logger.info("Graph of session {} is restored".format(self._session))
+            self._begin_update()
+            try:
+                graph = Graph(self.logger, self._vocabulary)
+                graph.restore(record)
+                self.data = {0: graph}
+                self._views = dict()
+                self._layouts = dict()
+                self._version = meta['version']
+                self._original = meta['original']
+                self._excluded = meta['excluded']
+            finally:
+                self._end_update()
+        self._state = meta['state']
+
+    def _publish(self):
+        """
+        Shares the loaded graph and its already built levels with other workers
+        """
+        if not self._backend.SHARED:
+            return
+        meta = {'version': self._version, 'state': self._state,
+                'original': self._original, 'excluded': self._excluded}
+        self._backend.publish(self._session, meta, self.data[0].dump())
+        for level in sorted(self.data.keys())[1:]:
+            self._backend.save_delta(self._session, self._version, level,
+                                     self.data[level].diff(self.data[level - 1]))
+
+    def _begin_update(self):
+        """
+        Cancels computations for the loaded graph and waits for running ones,
+        so the graph can be changed in place
+        """
+        with self._lock:
+            while self._updating:
+                self._lock.wait()
+            self._updating = True
+            self._generation += 1
+            running = list(self._inflight.values())
+        if self._precomputation:
+            self._precomputation.cancel()
+        wait(running)
+
+    def _end_update(self):
+        with self._lock:
+            self._updating = False
+            self._lock.notify_all()
+
+    def _revise(self, revision: Revision):
+        """
+        Updates already built levels with the re-uploaded changes,
+        levels affected by the changes are dropped and rebuilt on demand
+        :param revision: difference with the loaded graph
+        """
+        self.logger.info("Uploaded graph is a revision: {} added, {} removed statements".format(
+            len(revision.added), len(revision.removed)))
+        if revision.is_empty:
+            return
+        with self.progress.stage('revision', added=len(revision.added), removed=len(revision.removed)):
+            self._apply_revision(revision)
+
+    def _apply_revision(self, revision: Revision):
+        if not revision.is_compatible:
+            self.data[0].set_data(revision.new)
+            self._views.pop(0, None)
+            self._layouts.pop(0, None)
+            stale = 1
+        else:
+            stale = self._first_stale_level(revision)
+            for level in range(stale):
+                self.data[level].apply_revision(revision)
+                self._views.pop(level, None)
+                self._layouts.pop(level, None)
+        for level in range(stale, self.MAX_LEVEL + 1):
+            self.data.pop(level, None)
+            self._views.pop(level, None)
+            self._layouts.pop(level, None)
+        self.logger.info("Levels from {} are to be rebuilt".format(stale))
+
+    def _first_stale_level(self, revision: Revision) -> int:
+        """
+        Finds the first level, which cannot be updated by replaying the revision,
+        i.e. its rule modified one of the revised nodes
+        :param revision: difference with the loaded graph
+        :return: number of level
+        """
+        if not revision.is_local:
+            return 1
+        subjects = revision.subjects
+        level = 1
+        while level in self.data:
+            previous, current = self.data[level - 1].data, self.data[level].data
+            if any(set(previous.triples((s, None, None))) != set(current.triples((s, None, None)))
+                   for s in subjects):
+                return level
+            level += 1
+        return level
+
+    ##############################################
+    # Levels computation
+    ##############################################
+    def _shared(self, cache_name: str, level: int, compute):
+        """
+        Returns cached value of the level or computes it,
+        concurrent callers wait for the same computation instead of repeating it
+        :param cache_name: name of the cache attribute, 'data' or '_views'
+        :param level: number of level
+        :param compute: function, that computes the value for the level
+        :return: value for the level
+        """
+        key = (cache_name, level)
+        nested = getattr(self._local, 'generation', None)
+        while True:
+            with self._lock:
+                while self._updating or (nested not in (None, self._generation)):
+                    if nested is not None:
+                        # graph is being replaced, this computation is useless
+                        raise CancelledError()
+                    self._lock.wait()
+                cache = getattr(self, cache_name)
+                if level in cache:
+                    return cache[level]
+                future = self._inflight.get(key)
+                owner = future is None
+                if owner:
+                    future = Future()
+                    self._inflight[key] = future
+                    generation = self._generation
+            if not owner:
+                # value is cached by the owner, unless graph was replaced meanwhile
+                future.exception()
+                continue
+            try:
+                self._local.generation = generation
+                result = compute(level)
+            except BaseException as e:
+                with self._lock:
+                    del self._inflight[key]
+                future.set_exception(e)
+                if (nested is None) and isinstance(e, CancelledError):
+                    continue
+                raise
+            finally:
+                self._local.generation = nested
+            with self._lock:
+                del self._inflight[key]
+                published = generation == self._generation
+                if published and result is not None:
+                    getattr(self, cache_name)[level] = result
+            future.set_result(result)
+            if published:
+                return result
+
+    def _level(self, level: int) -> Graph:
+        return self._shared('data', level, self._compute_level)
+
+    def _compute_level(self, level: int) -> Graph:
+        """
+        Applies the rule of the level to the copy of the previous one
+        :param level: number of level to be built
+        :return: graph of the level
+        """
+        previous = self._level(level - 1)
+        with self.progress.stage('R{}'.format(level), statements=len(previous.data)) as result:
+            graph = copy.deepcopy(previous)
+            delta = self._backend.delta(self._session, self._version, level)
+            if delta:
+                # already built by another worker
+                graph.apply_diff(delta)
+            else:
+                self._rules[level](graph)
+                if self._backend.SHARED:
+                    self._backend.save_delta(self._session, self._version, level, graph.diff(previous))
+            result['statements'] = len(graph.data)
+        return graph
+
+    def _view(self, level: int):
+        return self._shared('_views', level, self._compute_view)
+
+    def _compute_view(self, level: int):
+        view = self._backend.view(self._session, self._version, level)
+        if view is None:
+            graph = self._level(level)
+            with self._tracer.track('visualize'), self.progress.stage('visualization', level=level) as result:
+                view = graph.visualize(self._original, self._excluded)
+                if view:
+                    result.update(nodes=len(view['nodes']), links=len(view['links']))
+            if view:
+                self._backend.save_view(self._session, self._version, level, view)
+        return view
+
+    def _layout(self, level: int):
+        return self._shared('_layouts', level, self._compute_layout)
+
+    def _compute_layout(self, level: int):
+        """
+        Places nodes of the visualization,
+        nodes already placed on the neighbouring level keep their positions
+        :param level: number of level
+        :return: dictionary node id -> [x, y], its hash
+        """
+        view = self._view(level)
+        if not view:
+            return None
+        neighbour = self._layouts.get(level - 1) or self._layouts.get(level + 1)
+        with self.progress.stage('layout', level=level, nodes=len(view['nodes'])):
+            positions = force_layout(view['nodes'], view['links'], neighbour[0] if neighbour else None)
+        self.logger.info("Layout of level {} is computed for {} nodes".format(level, len(positions)))
+        content = json.dumps(sorted(positions.items()), default=str)
+        return positions, hashlib.sha256(content.encode()).hexdigest()
+
+    def _start_precomputation(self):
+        if self._executor:
+            self._precomputation = self._executor.submit(self._precompute, self._generation)
+
+    def _precompute(self, generation: int):
+        """
+        Builds and visualizes all levels in background,
+        stops as soon as a new upload replaces the graph
+        :param generation: number of upload the levels are computed for
+        """
+        for level in range(1, self.MAX_LEVEL + 1):
+            if generation != self._generation:
+                self.logger.info("Precomputation of levels is cancelled")
+                return
+            try:
+                self._view(level)
+            except:
+                self.logger.error("Not able to precompute level {}".format(level))
+                return
+        self.logger.info("All levels are precomputed")
+
+    ##############################################
+    # Navigation
+    ##############################################
+    def visualize(self, layout: bool = False):
         if self.data:
-            if self._state in self.data:
-                return self.data[self._state].visualize(self._original, self._excluded)
+            return self._laid_out(self._state) if layout else self._view(self._state)
+
+    def _laid_out(self, level: int):
+        view = self._view(level)
+        if view:
+            return place(view, self._layout(level)[0])
+        return view
+
+    def view(self, level: int = None, layout: bool = False):
+        """
+        Visualizes the level without changing the state
+        :param level: number of level, the current one if None
+        :param layout: if True nodes have coordinates
+        :return: json-like graph structure, its entity tag
+        """
+        with self._transitions:
+            self._sync()
+            if level is None:
+                level = self._state
+        if not self.data:
+            return None, None
+        view = self._view(level)
+        if not view:
+            return None, None
+        if layout:
+            positions, digest = self._layout(level)
+            # coordinates could change, while the visualization stays the same
+            etag = hashlib.sha256((self._etag(level, view) + digest).encode()).hexdigest()
+            return place(view, positions), etag
+        return view, self._etag(level, view)
+
+    def _etag(self, level: int, view: dict) -> str:
+        """
+        Hashes the visualization together with its options,
+        the hash is kept as long as the same visualization is cached
+        :param level: number of level
+        :param view: json-like graph structure of the level
+        :return: hex digest
+        """
+        cached = self._etags.get(level)
+        if cached and (cached[0] is view):
+            return cached[1]
+        content = json.dumps([self._original, self._excluded, view], sort_keys=True, default=str)
+        etag = hashlib.sha256(content.encode()).hexdigest()
+        with self._lock:
+            # tags of dropped visualizations are not needed anymore
+            self._etags = {n: cached for n, cached in self._etags.items() if self._views.get(n) is cached[0]}
+            self._etags[level] = (view, etag)
+        return etag
+
+    def _transition(self, key: tuple, function):
+        """
+        Changes the state exclusively, concurrent identical changes
+        are coalesced and share the result of the running one
+        :param key: operation name and arguments
+        :param function: function, that changes the state
+        :return: result of the function
+        """
+        with self._lock:
+            future = self._operations.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._operations[key] = future
+        if not owner:
+            return future.result()
+        try:
+            with self._transitions:
+                result = function()
+        except BaseException as e:
+            with self._lock:
+                del self._operations[key]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            del self._operations[key]
+        future.set_result(result)
+        return result
+
+    def _step(self, step, layout: bool = False):
+        """
+        Changes the state consistently with other workers
+        :param step: function from the current state to the new one
+        :param layout: if True nodes have coordinates
+        :return: json-like graph structure of the new state
+        """
+        while True:
+            self._sync()
+            state = step(self._state)
+            if self._backend.update_state(self._session, self._version, self._state, state):
+                self._state = state
+                return self.visualize(layout)
 
-    def plus(self):
-        if self._state + 1 in self.data:
-            self._state += 1
-        elif self._state + 1 > 4:
+    def plus(self, layout: bool = False):
+        with self._tracer.track('plus'), self.progress.operation('plus'):
+            return self._transition(('plus', layout), partial(self._step, self._zoom_in, layout))
+
+    def _zoom_in(self, state: int) -> int:
+        if state + 1 > self.MAX_LEVEL:
             self.logger.info("No further zoom-in is possible")
-        else:
-            self._state += 1
-            self.data[self._state] = copy.deepcopy(self.data[self._state - 1])
-            if self._state == 1:
-                self._rules_applicator.apply_r1(self.data[self._state])
-            if self._state == 2:
-                self._rules_applicator.apply_r2(self.data[self._state])
-            if self._state == 3:
-                self._rules_applicator.apply_r3(self.data[self._state])
-            if self._state == 4:
-                self._rules_applicator.apply_r4(self.data[self._state])
-        return self.visualize()
-
-    def minus(self):
-        if self._state - 1 in self.data:
-            self._state -= 1
-        else:
-            self.logger.info("No further zoom-out is possible")
-        return self.visualize()
+            return state
+        return state + 1
+
+    def minus(self, layout: bool = False):
+        with self.progress.operation('minus'):
+            return self._transition(('minus', layout), partial(self._step, self._zoom_out, layout))
+
+    def _zoom_out(self, state: int) -> int:
+        if state > 0:
+            return state - 1
+        self.logger.info("No further zoom-out is possible")
+        return state
+
+    def level(self, level: int, layout: bool = False):
+        """
+        Jumps directly to the level, intermediate levels are built without visualization
+        :param level: number of level
+        :param layout: if True nodes have coordinates
+        :return: json-like graph structure of the level
+        """
+        if not 0 <= level <= self.MAX_LEVEL:
+            self.logger.info("No level {} is possible".format(level))
+            return None
+        with self.progress.operation('level'):
+            return self._transition(('level', level, layout), partial(self._step, lambda _: level, layout))
+
+    def levels(self) -> list:
+        """
+        Builds all levels without visualization
+        :return: list of levels' statistics
+        """
+        with self._transitions:
+            self._sync()
+        result = []
+        for level in range(self.MAX_LEVEL + 1):
+            description = self._level(level).summarize()
+            description['level'] = level
+            result.append(description)
+        return result
+
+    def memory(self) -> list:
+        """
+        Estimates memory used by the already built levels and their visualizations,
+        nothing is built and other operations are not blocked
+        :return: list of levels' sizes in bytes
+        """
+        while True:
+            with self._lock:
+                while self._updating:
+                    self._lock.wait()
+                generation = self._generation
+                levels = dict(self.data or {})
+                views = dict(self._views)
+            try:
+                result = self._estimate(levels, views)
+            except RuntimeError:
+                # levels are changed in place only by uploads
+                result = None
+            with self._lock:
+                if (result is not None) and (generation == self._generation):
+                    return result
+
+    @staticmethod
+    def _estimate(levels: dict, views: dict) -> list:
+        result = []
+        for level in sorted(levels.keys()):
+            seen = set()
+            description = levels[level].memory(seen)
+            description['level'] = level
+            # terms shared with the graph are not counted in the view
+            description['view'] = deep_size(views[level], seen) if level in views else None
+            result.append(description)
+        return result
@@ -0,0 +1,71 @@
+import json
+
+from csum import NDJSON_CHUNK
+
+MEDIA_TYPE = 'application/x-ndjson'
+MEDIA_TYPES = [MEDIA_TYPE, 'application/ndjson', 'application/jsonl']
+
+
+def accepts(accept: str) -> bool:
+    """
+    Checks if the client asked for the streamed format
+    :param accept: value of the Accept header
+    :return: True if one of the newline-delimited json media types is accepted
+    """
+    if not accept:
+        return False
+    return any(media.split(';')[0].strip() in MEDIA_TYPES for media in accept.split(','))
+
+
+def encode(graph_json, progress=None, chunk: int = NDJSON_CHUNK):
+    """
+    Streams visualization line by line: description with numbers of nodes and links first,
+    then nodes and links by chunks, so the client can draw them as they come
+    :param graph_json: json-like graph structure or list of them
+    :param progress: Progress object to report encoded items
+    :param chunk: number of nodes or links per line
+    :return: generator of lines
+    """
+    if isinstance(graph_json, list):
+        for item in graph_json:
+            yield _line(item)
+        return
+    nodes = graph_json.get('nodes', [])
+    links = graph_json.get('links', [])
+    total = len(nodes) + len(links)
+    if progress:
+        progress.publish('encoding', 'started', format='ndjson', nodes=len(nodes), links=len(links))
+    yield _line({'graph': graph_json.get('graph'), 'nodes': len(nodes), 'links': len(links)})
+    processed = 0
+    for key, items in (('nodes', nodes), ('links', links)):
+        for start in range(0, len(items), chunk):
+            part = items[start:start + chunk]
+            yield _line({key: part})
+            processed += len(part)
+            if progress:
+                progress.advance('encoding', processed, total)
+    if progress:
+        progress.publish('encoding', 'done', format='ndjson', nodes=len(nodes), links=len(links))
+
+
+def decode(lines) -> dict:
+    """
+    Restores visualization from the streamed lines
+    :param lines: iterable of lines made by encode
+    :return: json-like graph structure
+    """
+    result = {'nodes': [], 'links': []}
+    for line in lines:
+        if not line.strip():
+            continue
+        item = json.loads(line)
+        if 'graph' in item:
+            result['graph'] = item['graph']
+        else:
+            for key, values in item.items():
+                result[key].extend(values)
+    return result
+
+
+def _line(item) -> str:
+    return json.dumps(item, default=str) + '\n'
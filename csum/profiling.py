@@ -0,0 +1,114 @@
+import cProfile
+import io
+import marshal
+import pstats
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from uuid import uuid4
+
+from csum import PROFILE_LIMIT, PROFILE_TOP
+
+# only one profiler can be active in the process
+_profiler = threading.Lock()
+
+
+class Profile:
+    def __init__(self, name: str):
+        self.id = uuid4().hex
+        self.name = name
+        self.created = time.time()
+        self.duration = None
+        self.stats = None
+
+    def report(self, top: int = PROFILE_TOP) -> str:
+        """
+        Describes the hottest functions and calls between functions of csum
+        :param top: number of functions in every section
+        :return: text report
+        """
+        stream = io.StringIO()
+        stream.write("{} {} took {:.3f} s\n\n".format(self.name, self.id, self.duration))
+        stats = pstats.Stats(self.stats, stream=stream)
+        stream.write("Cumulative time\n")
+        stats.sort_stats('cumulative').print_stats(top)
+        stream.write("Internal time\n")
+        stats.sort_stats('tottime').print_stats(top)
+        stream.write("Call tree of csum\n")
+        stats.sort_stats('cumulative').print_callees(r'csum[/\\]', top)
+        return stream.getvalue()
+
+    def dump(self) -> bytes:
+        """
+        :return: raw statistics, the same as written by pstats.Stats.dump_stats
+        """
+        return marshal.dumps(pstats.Stats(self.stats).stats)
+
+
+class Profiles:
+    """
+    Profiles requests one at a time and keeps the last reports.
+    Before Python 3.12 only the thread of the request is profiled, work done in other threads
+    (e.g. precomputation) is seen as waiting. Since 3.12 the whole process is profiled,
+    so the report includes other requests and background work running meanwhile
+    """
+    def __init__(self, logger, limit: int = PROFILE_LIMIT):
+        self.logger = logger
+        self._limit = limit
+        self._profiles = OrderedDict()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def profile(self, name: str):
+        """
+        Profiles the block with cProfile
+        :param name: name of the request, e.g. plus
+        :return: Profile object, its report is ready after the block,
+        or None if another block is being profiled
+        """
+        profiler = cProfile.Profile()
+        if not self._enable(profiler):
+            self.logger.warning("Request {} is not profiled, another one is".format(name))
+            yield None
+            return
+        profile = Profile(name)
+        started = time.perf_counter()
+        try:
+            yield profile
+        finally:
+            profiler.disable()
+            _profiler.release()
+            profile.duration = time.perf_counter() - started
+            profile.stats = profiler
+            self.logger.info("Request {} is profiled as {}".format(name, profile.id))
+            with self._lock:
+                self._profiles[profile.id] = profile
+                while len(self._profiles) > self._limit:
+                    self._profiles.popitem(last=False)
+
+    @staticmethod
+    def _enable(profiler: cProfile.Profile) -> bool:
+        """
+        Starts the profiler, unless another one is active
+        :param profiler: cProfile.Profile object
+        :return: True if started
+        """
+        if not _profiler.acquire(blocking=False):
+            return False
+        try:
+            profiler.enable()
+        except ValueError:
+            # another profiling tool is active, e.g. a debugger since Python 3.12
+            _profiler.release()
+            return False
+        return True
+
+    def get(self, profile_id: str):
+        with self._lock:
+            return self._profiles.get(profile_id)
+
+    def list(self) -> list:
+        with self._lock:
+            return [{'id': profile.id, 'name': profile.name, 'created': profile.created,
+                     'duration': profile.duration} for profile in reversed(self._profiles.values())]
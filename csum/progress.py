@@ -0,0 +1,128 @@
+import asyncio
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from csum import PROGRESS_KEEPALIVE
+
+# minimal interval between events about the same stage, seconds
+INTERVAL = 0.25
+
+
+class Progress:
+    """
+    Publishes stages of long operations on a graph to the subscribers,
+    e.g. parsing, classification, rules, visualization and encoding
+    """
+    def __init__(self, limit: int = 100):
+        self._subscribers = []
+        # events of the last operation, replayed to the new subscribers
+        self._history = deque(maxlen=limit)
+        # stage -> time of the last event
+        self._published = dict()
+        self._lock = threading.Lock()
+
+    def publish(self, stage: str, status: str, **counts):
+        """
+        Sends event to all subscribers
+        :param stage: name of the stage
+        :param status: started, progress, done or failed
+        :param counts: numbers of processed items
+        """
+        event = {'stage': stage, 'status': status, 'time': round(time.time(), 3)}
+        event.update(counts)
+        with self._lock:
+            self._published[stage] = time.monotonic()
+            self._history.append(event)
+            for loop, subscriber in self._subscribers:
+                # subscribers wait in the event loop, publishers run in worker threads
+                try:
+                    loop.call_soon_threadsafe(subscriber.put_nowait, event)
+                except RuntimeError:
+                    # the loop is closed, the subscriber is gone with it
+                    pass
+
+    def advance(self, stage: str, processed: int, total: int):
+        """
+        Reports items processed by the stage, not more often than INTERVAL
+        :param stage: name of the stage
+        :param processed: number of processed items
+        :param total: number of all items
+        """
+        if (processed < total) and (time.monotonic() - self._published.get(stage, 0) < INTERVAL):
+            return
+        self.publish(stage, 'progress', processed=processed, total=total)
+
+    @contextmanager
+    def stage(self, stage: str, **counts):
+        """
+        Reports start and end of the stage
+        :param stage: name of the stage
+        :param counts: numbers known at the start
+        :return: dictionary to be filled with numbers reported at the end
+        """
+        self.publish(stage, 'started', **counts)
+        result = dict()
+        try:
+            yield result
+        except BaseException:
+            self.publish(stage, 'failed', **result)
+            raise
+        self.publish(stage, 'done', **result)
+
+    @contextmanager
+    def operation(self, name: str):
+        """
+        Reports the operation requested by the client, e.g. load_data or plus
+        :param name: name of the operation
+        """
+        with self._lock:
+            self._history.clear()
+        with self.stage(name) as result:
+            yield result
+
+    def subscribe(self) -> asyncio.Queue:
+        """
+        Must be called in the running event loop
+        :return: queue of events, starting with the ones of the last operation
+        """
+        loop = asyncio.get_running_loop()
+        subscriber = asyncio.Queue()
+        with self._lock:
+            for event in self._history:
+                subscriber.put_nowait(event)
+            self._subscribers.append((loop, subscriber))
+        return subscriber
+
+    @property
+    def subscribed(self) -> bool:
+        with self._lock:
+            return bool(self._subscribers)
+
+    def unsubscribe(self, subscriber: asyncio.Queue):
+        with self._lock:
+            self._subscribers = [(loop, queue) for loop, queue in self._subscribers if queue is not subscriber]
+
+
+async def server_sent_events(progress: Progress, request, keepalive: float = PROGRESS_KEEPALIVE):
+    """
+    Formats events as text/event-stream, until the client disconnects,
+    waits in the event loop, so open streams do not hold worker threads
+    :param progress: Progress object of the graph
+    :param request: request of the stream, checked for disconnection
+    :param keepalive: interval of comments, which keep the connection open
+    :return: asynchronous generator of strings
+    """
+    subscriber = progress.subscribe()
+    try:
+        while not await request.is_disconnected():
+            try:
+                event = await asyncio.wait_for(subscriber.get(), keepalive)
+            except asyncio.TimeoutError:
+                yield ': keep-alive\n\n'
+                continue
+            yield 'data: {}\n\n'.format(json.dumps(event))
+    finally:
+        progress.unsubscribe(subscriber)
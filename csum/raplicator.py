@@ -4,11 +4,14 @@ from rdflib.namespace import RDF, RDFS, OWL
 
 from csum import LANGUAGE
 from csum.graph import Graph
+from csum.progress import Progress
 
 
 class RApplicator:
-    def __init__(self, logger):
+    def __init__(self, logger, progress: Progress = None):
         self.logger = logger
+        # reports processed items of the rules
+        self.progress = progress or Progress()
 
     ##############################################
     # R1
@@ -19,9 +22,11 @@ class RApplicator:
         :param graph: graph for processing
         """
         # this one is only possible, because we know relators already
-        relations = self._get_relator_endurants(graph.data, graph.relators, graph.endurants)
+        relations = self._get_relator_endurants(graph.restrictions, graph.relators, graph.endurants)
         # process relators one by one
-        for relator in graph.relators:
+        total = len(graph.relators)
+        for n, relator in enumerate(graph.relators):
+            self.progress.advance('R1', n + 1, total)
             if relator in relations:
                 mediations = list(relations[relator].keys())
                 # if this relator mediates at least 2 endurants
@@ -32,36 +37,30 @@ class RApplicator:
                                 graph, relations, relator, mediations[i], mediations[j], str(i)+str(j)
                             )
                     # remove relator and all bnodes from it
-                    graph.data.remove((relator, None, None))
+                    graph.remove_node(relator)
                     for r in mediations:
-                        graph.data.remove((relations[relator][r], None, None))
+                        graph.remove_node(relations[relator][r].node)
         # update relators
         graph.reset_relators()
 
     @staticmethod
-    def _get_relator_endurants(graph, relators: set, endurants: set):
+    def _get_relator_endurants(restrictions: dict, relators: set, endurants: set):
         """
-        Forms a dictionary with bnodes between relators-endurants
-        :param graph: RDFGraph object
+        Forms a dictionary with restrictions between relators-endurants
+        :param restrictions: dictionary {class -> [Restriction]} of the graph
         :param relators: set of relators
         :param endurants: set of endurants
-        :return: dictionary {relator -> {endurant -> bnode}}
+        :return: dictionary {relator -> {endurant -> Restriction}}
         """
         result = {}
         all_nodes = relators.copy()
         all_nodes.update(endurants)
         for relator in all_nodes:
-            for (_, _, bnode) in graph.triples((relator, RDFS.subClassOf, None)):
-                for (_, _, endurant) in graph.triples((bnode, OWL.onClass, None)):
-                    if relator not in result:
-                        result[relator] = {}
-                    result[relator][endurant] = bnode
-                    endurants.add(endurant)
-                for (_, _, endurant) in graph.triples((bnode, OWL.someValuesFrom, None)):
+            for restriction in restrictions.get(relator, []):
+                for endurant in restriction.fillers:
                     if relator not in result:
                         result[relator] = {}
-                    result[relator][endurant] = bnode
-                    endurants.add(endurant)
+                    result[relator][endurant] = restriction
         return result
 
     def _process_endurants(self, graph, relations, relator, endurant1, endurant2, rname):
@@ -82,12 +81,12 @@ class RApplicator:
             )
         # There is a connection between {endurant1} and {endurant2}
         for endurant in [endurant1, endurant2]:
-            bnode1 = relations[endurant][relator]
-            bnode2 = relations[relator][endurant]
-            self._move_cardinality(graph.data, bnode1, connection)
-            self._move_cardinality(graph.data, bnode2, connection)
-            graph.data.remove((endurant, None, bnode1))
-            graph.data.remove((bnode1, None, None))
+            restriction1 = relations[endurant][relator]
+            restriction2 = relations[relator][endurant]
+            self._move_cardinality(graph, endurant, restriction1, connection)
+            self._move_cardinality(graph, relator, restriction2, connection)
+            graph.data.remove((endurant, None, restriction1.node))
+            graph.remove_node(restriction1.node)
 
     @staticmethod
     def _get_connection(graph, endurant1, endurant2):
@@ -127,12 +126,12 @@ class RApplicator:
         return connection
 
     @staticmethod
-    def _move_cardinality(graph, from_node, to_node):
-        for cardinality in [OWL.qualifiedCardinality,
-                            OWL.minQualifiedCardinality,
-                            OWL.maxQualifiedCardinality]:
-            for (s, p, o) in graph.triples((from_node, cardinality, None)):
-                graph.add((to_node, p, o))
+    def _move_cardinality(graph, cls, restriction, to_node):
+        # restriction is already removed together with its cardinalities
+        if restriction not in graph.restrictions.get(cls, []):
+            return
+        for (p, o) in restriction.cardinalities:
+            graph.data.add((to_node, p, o))
 
     ##############################################
     # Additional functions, to be used by R2-R4 rules
@@ -231,7 +230,9 @@ class RApplicator:
         Applies R2 rule to the given graph
         :param graph: graph object
         """
-        for nonsortal in graph.nonsortals:
+        total = len(graph.nonsortals)
+        for n, nonsortal in enumerate(graph.nonsortals):
+            self.progress.advance('R2', n + 1, total)
             endurants = self._get_sub_classes(graph, nonsortal)
             if endurants:
                 for predicate in [RDFS.domain, RDFS.range]:
@@ -246,6 +247,7 @@ class RApplicator:
                 graph.data.remove((nonsortal, None, None))
         # nonsortals should be updated
         graph.reset_endurants()
+        graph.reset_restrictions()
 
     ##############################################
     # R3
@@ -258,12 +260,14 @@ class RApplicator:
         roles_tree = dict()
         graph.get_disjoint_by_name('Role', roles_tree)
         not_seen = set(roles_tree.keys())
-        for kind in roles_tree.keys():
+        for i, kind in enumerate(roles_tree.keys()):
+            self.progress.advance('R3', i + 1, len(roles_tree))
             if kind in not_seen:
                 self._moves_to_ancestor(graph, roles_tree, not_seen, kind)
         # reset sortals
         # TODO: fix an error, removes organization?
         graph.reset_endurants()
+        graph.reset_restrictions()
 
     def _moves_to_ancestor(self, graph, roles_tree, not_seen, ancestor):
         for descendant in roles_tree[ancestor]['Role']:
@@ -287,26 +291,28 @@ class RApplicator:
         disjoints = dict()
         graph.get_disjoint_by_name('SubKind', disjoints)
         graph.get_disjoint_by_name('Phase', disjoints)
-        for kind in disjoints.keys():
+        for i, kind in enumerate(disjoints.keys()):
+            self.progress.advance('R4', i + 1, len(disjoints))
             self._process_kind(graph, kind, disjoints, superclasses)
+        graph.reset_restrictions()
 
     def _process_kind(self, graph, key, tree, superclasses):
         # this key was already processed
         if key not in superclasses:
             return
-        # print("working item is", key)
+        self.logger.debug("R4: working item is %s", key)
         for role in ['Phase', 'SubKind']:
             if role in tree[key]:
                 for r in tree[key][role]:
                     if r in superclasses:
                         self._process_kind(graph, r, tree, superclasses)
-                        print("removing from superclasses", r)
+                        self.logger.debug("R4: removing from superclasses %s", r)
                         # superclasses.remove(r)
                     for predicate in [RDFS.domain, RDFS.range]:
                         for (relation, _, _) in graph.data.triples((None, predicate, r)):
-                            print("move from ", r, " to ", key)
+                            self.logger.debug("R4: move from %s to %s", r, key)
                             self._move_relation(graph, relation, r, key)
-                print("create enumeration to ", key, " namely ", tree[key][role])
+                self.logger.debug("R4: create enumeration to %s namely %s", key, tree[key][role])
                 enumeration = URIRef(str(key) + "Enumeration")
                 graph.data.add((enumeration, RDF.type, RDF.List))
                 prev = RDF.nil
@@ -322,7 +328,7 @@ class RApplicator:
                 graph.data.add((connection, RDF.type, OWL.ObjectProperty))
                 graph.data.add((connection, RDFS.domain, key))
                 graph.data.add((connection, RDFS.range, enumeration))
-        print("removing ", key)
+        self.logger.debug("R4: removing %s", key)
         superclasses.remove(key)
         # graph.data.remove((key, None, None))
 
@@ -0,0 +1,85 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from csum import COLOUR_BASIC, RENDER_WORKERS, RENDER_CACHE
+
+# format -> media type
+FORMATS = {'dot': 'text/vnd.graphviz', 'svg': 'image/svg+xml', 'png': 'image/png'}
+
+
+def to_dot(view: dict):
+    """
+    Converts visualization into graphviz graph
+    :param view: json-like graph structure
+    :return: graphviz.Digraph object
+    """
+    from graphviz import Digraph
+    dot = Digraph(graph_attr={'rankdir': 'BT'},
+                  node_attr={'shape': 'box', 'style': 'rounded,filled', 'fontname': 'Helvetica'},
+                  edge_attr={'fontname': 'Helvetica', 'fontsize': '10'})
+    names = dict()
+    for node in view['nodes']:
+        names[node['id']] = 'n{}'.format(len(names))
+        dot.node(names[node['id']], label=str(node.get('label', node['id'])),
+                 fillcolor=node.get('color', COLOUR_BASIC), tooltip=str(node['id']))
+    for link in view['links']:
+        if (link['source'] in names) and (link['target'] in names):
+            dot.edge(names[link['source']], names[link['target']], label=str(link.get('label', '')),
+                     style='dashed' if link.get('strokeDasharray') else 'solid')
+    return dot
+
+
+class Renderer:
+    """
+    Renders visualizations in background threads,
+    results are cached by the hash of the visualization, so equal views are rendered once
+    """
+    def __init__(self, logger, workers: int = RENDER_WORKERS, limit: int = RENDER_CACHE):
+        self.logger = logger
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='render')
+        self._limit = limit
+        # (hash, format) -> rendered content, the least recently used ones are dropped
+        self._cache = OrderedDict()
+        # (hash, format) -> future of the queued rendering
+        self._pending = dict()
+        self._lock = threading.Lock()
+
+    def render(self, digest: str, view: dict, fmt: str) -> Future:
+        """
+        Queues rendering, unless it is cached or already queued
+        :param digest: hash of the visualization
+        :param view: json-like graph structure
+        :param fmt: one of FORMATS
+        :return: future of the rendered content
+        """
+        key = (digest, fmt)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                future = Future()
+                future.set_result(self._cache[key])
+                return future
+            future = self._pending.get(key)
+            if future is None:
+                future = self._executor.submit(self._render, key, view)
+                self._pending[key] = future
+            return future
+
+    def _render(self, key: tuple, view: dict) -> bytes:
+        digest, fmt = key
+        try:
+            dot = to_dot(view)
+            content = dot.source.encode() if fmt == 'dot' else dot.pipe(format=fmt)
+        except:
+            self.logger.error("Not able to render the graph as {}".format(fmt))
+            with self._lock:
+                del self._pending[key]
+            raise
+        self.logger.info("Graph {} is rendered as {}, {} bytes".format(digest[:8], fmt, len(content)))
+        with self._lock:
+            del self._pending[key]
+            self._cache[key] = content
+            while len(self._cache) > self._limit:
+                self._cache.popitem(last=False)
+        return content
@@ -0,0 +1,91 @@
+from collections import Counter
+
+from rdflib import BNode, Graph as RDFGraph
+from rdflib.namespace import RDF, RDFS, OWL
+
+
+class Revision:
+    """
+    Difference between the loaded Graph and its re-uploaded version, statements with blank nodes
+    are compared only if the upload is similar enough to be a revision
+    """
+    # predicates read by the classification or by R1-R4 on nodes they do not modify
+    STRUCTURAL = {RDF.type, RDFS.subClassOf, RDFS.domain, RDFS.range,
+                  OWL.onProperty, OWL.inverseOf, OWL.onClass, OWL.someValuesFrom,
+                  OWL.qualifiedCardinality, OWL.minQualifiedCardinality,
+                  OWL.maxQualifiedCardinality, RDF.first, RDF.rest}
+    CLASSIFYING = {RDF.type, RDFS.subClassOf}
+
+    def __init__(self, old, new: RDFGraph, similarity: float = 0):
+        self.new = new
+        self.n_statements = len(new)
+        old_ground, old_blank = self._split(old.data)
+        new_ground, new_blank = self._split(new)
+        self.added = new_ground - old_ground
+        self.removed = old_ground - new_ground
+        common = len(old_ground) - len(self.removed)
+        self.similarity = common / max(len(old_ground), len(new_ground), 1)
+        self.is_revision = self.similarity >= similarity
+        # dissimilar upload is rebuilt anyway
+        self.is_compatible = self.is_revision and \
+            (dict(old.data.namespaces()) == dict(new.namespaces())) and \
+            (self._shape(old_blank) == self._shape(new_blank)) and \
+            (old.restriction_records() == old.restriction_records(new))
+
+    @staticmethod
+    def _split(graph: RDFGraph) -> (set, list):
+        """
+        Splits graph into ground statements and statements with blank nodes
+        :param graph: RDFGraph object
+        :return: set of ground triples, list of triples with bnodes
+        """
+        ground = set()
+        blank = []
+        for triple in graph:
+            if any(type(term) is BNode for term in triple):
+                blank.append(triple)
+            else:
+                ground.add(triple)
+        return ground, blank
+
+    @staticmethod
+    def _shape(triples: list) -> Counter:
+        """
+        Counts statements with blank nodes regardless of the nodes,
+        how the nodes are connected to the classes is compared by their restrictions
+        :param triples: list of triples with bnodes
+        :return: Counter of triples with None instead of bnodes
+        """
+        return Counter(tuple(None if type(term) is BNode else term for term in triple) for triple in triples)
+
+    @property
+    def is_empty(self) -> bool:
+        return self.is_compatible and not self.added and not self.removed
+
+    @property
+    def is_local(self) -> bool:
+        """
+        Local revision changes only annotations of named nodes,
+        so it can be replayed on the levels, where R1-R4 did not touch these nodes
+        """
+        return self.is_compatible and \
+            all(p not in self.STRUCTURAL for (_, p, _) in self.added | self.removed)
+
+    @property
+    def affects_classification(self) -> bool:
+        return not self.is_compatible or \
+            any(p in self.CLASSIFYING for (_, p, _) in self.added | self.removed)
+
+    @property
+    def subjects(self) -> set:
+        return {s for (s, _, _) in self.added | self.removed}
+
+    def apply(self, graph: RDFGraph):
+        """
+        Replays the difference on the given graph
+        :param graph: RDFGraph object
+        """
+        for triple in self.removed:
+            graph.remove(triple)
+        for triple in self.added:
+            graph.add(triple)
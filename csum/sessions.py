@@ -0,0 +1,123 @@
+import threading
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+
+from csum import MAX_SESSIONS
+from csum.meta import MetaGraph
+from csum.progress import Progress
+from csum.state import StateBackend
+
+
+class Sessions:
+    """
+    Registry of users' graphs, sessions are created by uploads only.
+    The least recently used ones are dropped, if they can be restored from the shared backend
+    or have nothing loaded, new sessions are refused, if nothing can be dropped
+    """
+    DEFAULT = 'default'
+
+    def __init__(self, logger, executor=None, vocabulary=None, backend=None, limit: int = MAX_SESSIONS,
+                 tracer=None):
+        self.logger = logger
+        self._executor = executor
+        self._vocabulary = vocabulary
+        self._backend = backend or StateBackend()
+        self._limit = limit
+        self._tracer = tracer
+        self._graphs = OrderedDict()
+        # session -> number of running uploads, such sessions are not dropped
+        self._uploads = Counter()
+        # session without graph -> its progress, clients can wait for the first upload
+        self._waiting = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session: str):
+        """
+        Returns graph of the existing session
+        :param session: id of the session
+        :return: MetaGraph object or None if there is no such session
+        """
+        with self._lock:
+            graph = self._graphs.get(session)
+            if graph is not None:
+                self._graphs.move_to_end(session)
+                return graph
+            # dropped before or uploaded to another worker, can be dropped again
+            if self._backend.meta(session) is not None:
+                return self._add(session, force=True)
+        return None
+
+    def progress(self, session: str) -> Progress:
+        """
+        Returns progress of the session, also if nothing is uploaded yet,
+        such sessions are kept as long as they are subscribed
+        :param session: id of the session
+        :return: Progress object
+        """
+        with self._lock:
+            graph = self._graphs.get(session)
+            if graph is not None:
+                return graph.progress
+            progress = self._waiting.pop(session, None) or Progress()
+            self._waiting[session] = progress
+            idle = [name for name, waiting in self._waiting.items() if not waiting.subscribed]
+            for name in idle[:max(0, len(idle) - self._limit)]:
+                del self._waiting[name]
+            return progress
+
+    @contextmanager
+    def upload(self, session: str):
+        """
+        Keeps the session, while its graph is uploaded
+        :param session: id of the session
+        :return: MetaGraph object or None if the limit of sessions is reached
+        """
+        with self._lock:
+            graph = self._add(session)
+            if graph is not None:
+                self._uploads[session] += 1
+        try:
+            yield graph
+        finally:
+            if graph is not None:
+                with self._lock:
+                    self._uploads[session] -= 1
+                    if not self._uploads[session]:
+                        del self._uploads[session]
+
+    def _add(self, session: str, force: bool = False):
+        """
+        Returns graph of the session, creates it if there is room for it,
+        must be called under the lock
+        :param session: id of the session
+        :param force: if True, the session is created even over the limit
+        :return: MetaGraph object or None if the limit of sessions is reached
+        """
+        graph = self._graphs.pop(session, None)
+        if graph is None:
+            self._evict(self._limit - 1)
+            if (len(self._graphs) >= self._limit) and not force:
+                self.logger.warning("Session {} is refused, {} sessions are in use".format(
+                    session, len(self._graphs)))
+                return None
+            graph = MetaGraph(self.logger, self._executor, self._vocabulary,
+                              self._backend, session, self._tracer, self._waiting.pop(session, None))
+        self._graphs[session] = graph
+        return graph
+
+    def _evict(self, limit: int):
+        """
+        Drops the least recently used sessions over the limit, except the uploading ones
+        :param limit: number of sessions to be kept
+        """
+        for session in list(self._graphs.keys()):
+            if len(self._graphs) <= limit:
+                return
+            if session in self._uploads:
+                continue
+            if self._backend.SHARED or not self._graphs[session].data:
+                graph = self._graphs.pop(session)
+                if graph.progress.subscribed:
+                    # clients keep waiting for the session, if it is restored or uploaded again
+                    self._waiting[session] = graph.progress
+                self.logger.info("Session {} is dropped".format(session))
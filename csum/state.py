@@ -0,0 +1,175 @@
+import json
+import sqlite3
+import zlib
+from contextlib import closing
+
+from rdflib.util import from_n3
+
+
+def dump_triples(triples) -> list:
+    """
+    Converts triples to n3 notation, bnodes keep their ids
+    :param triples: iterable of rdflib triples
+    :return: list of lists of strings
+    """
+    return [[term.n3() for term in triple] for triple in triples]
+
+
+def load_triples(rows: list) -> list:
+    """
+    Restores triples from n3 notation
+    :param rows: list of lists of strings
+    :return: list of rdflib triples
+    """
+    return [tuple(from_n3(term) for term in row) for row in rows]
+
+
+class StateBackend:
+    """
+    Storage of sessions shared by the workers.
+    This one keeps nothing, so every worker has its own state
+    """
+    SHARED = False
+
+    def meta(self, session: str):
+        """
+        :param session: id of the session
+        :return: dictionary with version, state, original and excluded or None
+        """
+        return None
+
+    def publish(self, session: str, meta: dict, graph: dict):
+        """
+        Replaces graph of the session with a new version
+        :param session: id of the session
+        :param meta: dictionary with version, state, original and excluded
+        :param graph: serialized graph of level 0
+        """
+
+    def update_state(self, session: str, version: str, old: int, new: int) -> bool:
+        """
+        Changes the state, if nobody has changed it meanwhile
+        :param session: id of the session
+        :param version: version of the graph
+        :param old: expected state
+        :param new: new state
+        :return: True if changed
+        """
+        return True
+
+    def graph(self, session: str, version: str):
+        return None
+
+    def delta(self, session: str, version: str, level: int):
+        return None
+
+    def save_delta(self, session: str, version: str, level: int, delta: dict):
+        pass
+
+    def view(self, session: str, version: str, level: int):
+        return None
+
+    def save_view(self, session: str, version: str, level: int, view: dict):
+        pass
+
+
+class SQLiteBackend(StateBackend):
+    """
+    Keeps sessions in SQLite database, which is shared by the workers of the node
+    """
+    SHARED = True
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS sessions (
+            session TEXT PRIMARY KEY, version TEXT, state INTEGER, original INTEGER, excluded TEXT);
+        CREATE TABLE IF NOT EXISTS graphs (
+            session TEXT PRIMARY KEY, version TEXT, data BLOB);
+        CREATE TABLE IF NOT EXISTS levels (
+            session TEXT, version TEXT, level INTEGER, data BLOB,
+            PRIMARY KEY (session, version, level));
+        CREATE TABLE IF NOT EXISTS views (
+            session TEXT, version TEXT, level INTEGER, data BLOB,
+            PRIMARY KEY (session, version, level));
+    """
+
+    def __init__(self, path: str):
+        self._path = path
+        with closing(self._connect()) as connection:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.executescript(self.SCHEMA)
+
+    def _connect(self):
+        # autocommit mode, every statement is a transaction unless started explicitly
+        return sqlite3.connect(self._path, timeout=60, isolation_level=None)
+
+    @staticmethod
+    def _pack(value) -> bytes:
+        return zlib.compress(json.dumps(value, default=str).encode())
+
+    @staticmethod
+    def _unpack(data: bytes):
+        return json.loads(zlib.decompress(data))
+
+    def _select(self, query: str, *args):
+        with closing(self._connect()) as connection:
+            return connection.execute(query, args).fetchone()
+
+    def meta(self, session: str):
+        row = self._select('SELECT version, state, original, excluded FROM sessions WHERE session = ?',
+                           session)
+        if row is None:
+            return None
+        return {'version': row[0], 'state': row[1],
+                'original': bool(row[2]), 'excluded': json.loads(row[3])}
+
+    def publish(self, session: str, meta: dict, graph: dict):
+        with closing(self._connect()) as connection:
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                connection.execute('DELETE FROM levels WHERE session = ?', (session,))
+                connection.execute('DELETE FROM views WHERE session = ?', (session,))
+                connection.execute('REPLACE INTO graphs VALUES (?, ?, ?)',
+                                   (session, meta['version'], self._pack(graph)))
+                connection.execute('REPLACE INTO sessions VALUES (?, ?, ?, ?, ?)',
+                                   (session, meta['version'], meta['state'],
+                                    int(meta['original']), json.dumps(meta['excluded'])))
+                connection.execute('COMMIT')
+            except BaseException:
+                connection.execute('ROLLBACK')
+                raise
+
+    def update_state(self, session: str, version: str, old: int, new: int) -> bool:
+        with closing(self._connect()) as connection:
+            cursor = connection.execute(
+                'UPDATE sessions SET state = ? WHERE session = ? AND version = ? AND state = ?',
+                (new, session, version, old))
+            return cursor.rowcount == 1
+
+    def graph(self, session: str, version: str):
+        row = self._select('SELECT data FROM graphs WHERE session = ? AND version = ?',
+                           session, version)
+        return self._unpack(row[0]) if row else None
+
+    def _save(self, table: str, session: str, version: str, level: int, value: dict):
+        with closing(self._connect()) as connection:
+            # nothing is saved, if the version was already replaced
+            connection.execute(
+                'INSERT OR IGNORE INTO {} SELECT ?, ?, ?, ? '
+                'WHERE EXISTS (SELECT 1 FROM graphs WHERE session = ? AND version = ?)'.format(table),
+                (session, version, level, self._pack(value), session, version))
+
+    def _load(self, table: str, session: str, version: str, level: int):
+        row = self._select('SELECT data FROM {} WHERE session = ? AND version = ? AND level = ?'.format(table),
+                           session, version, level)
+        return self._unpack(row[0]) if row else None
+
+    def delta(self, session: str, version: str, level: int):
+        return self._load('levels', session, version, level)
+
+    def save_delta(self, session: str, version: str, level: int, delta: dict):
+        self._save('levels', session, version, level, delta)
+
+    def view(self, session: str, version: str, level: int):
+        return self._load('views', session, version, level)
+
+    def save_view(self, session: str, version: str, level: int, view: dict):
+        self._save('views', session, version, level, view)
@@ -0,0 +1,113 @@
+from rdflib import BNode, URIRef, Graph as RDFGraph
+from rdflib.namespace import RDF, RDFS
+from rdflib.paths import Path
+
+GUFO = 'http://purl.org/nemo/gufo#'
+
+
+class Vocabulary:
+    """
+    Base vocabularies (e.g. gUFO) loaded once and shared read-only by all graphs
+    """
+    # gufo's terms, which are used for the classification of graphs
+    CLASSIFYING = {RDFS.subClassOf: ['Relator'],
+                   RDF.type: ['Kind', 'SubKind', 'Phase', 'Role',
+                              'Category', 'RoleMixin', 'PhaseMixin', 'Mixin']}
+
+    def __init__(self, logger, sources: list):
+        self.logger = logger
+        self.data = RDFGraph()
+        for source in sources:
+            try:
+                self.data.parse(source, format="turtle")
+            except:
+                self.logger.error("Not able to parse base vocabulary {}".format(source))
+        self.logger.info("Base vocabularies have {} statements".format(len(self.data)))
+        # statements with bnodes cannot be matched with the uploaded ones
+        self.ground = frozenset(triple for triple in self.data
+                                if not any(type(term) is BNode for term in triple))
+        # (predicate, gufo's term) -> base nodes connected to the term
+        self._closures = dict()
+        for predicate, names in self.CLASSIFYING.items():
+            for name in names:
+                self.closure(predicate, URIRef(GUFO + name))
+
+    def __deepcopy__(self, memo):
+        # shared by all graphs and levels, never copied
+        return self
+
+    def closure(self, predicate, term) -> set:
+        """
+        Nodes of the base vocabularies transitively connected to the term by the predicate
+        :param predicate: rdf:type or rdfs:subClassOf
+        :param term: URIRef of the term
+        :return: set of nodes including the term itself
+        """
+        key = (predicate, term)
+        if key not in self._closures:
+            self._closures[key] = set(self.data.transitive_subjects(predicate, term))
+        return self._closures[key]
+
+    def layer(self):
+        """
+        :return: empty graph on top of the base vocabularies
+        """
+        return Layer(self)
+
+
+class Layer(RDFGraph):
+    """
+    Graph on top of the base vocabularies: their statements are not stored, but read through,
+    unless the upload did not have them or they were removed later (e.g. by the rules),
+    so the graph reads exactly as if everything was stored in it
+    """
+    def __init__(self, vocabulary: Vocabulary, store='default', identifier=None, hidden: set = None):
+        super().__init__(store, identifier)
+        self._vocabulary = vocabulary
+        # base statements, which are not part of the graph
+        self._hidden = set(vocabulary.ground) if hidden is None else hidden
+
+    def __reduce__(self):
+        # copies of levels are layers too, rdflib would make them plain graphs
+        return Layer, (self._vocabulary, self.store, self.identifier, self._hidden)
+
+    @property
+    def shared(self) -> int:
+        """
+        :return: number of statements read through from the base vocabularies
+        """
+        return len(self._vocabulary.ground) - len(self._hidden)
+
+    @property
+    def complete(self) -> bool:
+        return not self._hidden
+
+    def add(self, triple):
+        if triple in self._vocabulary.ground:
+            self._hidden.discard(triple)
+            return self
+        return super().add(triple)
+
+    def addN(self, quads):
+        for s, p, o, c in quads:
+            if getattr(c, 'identifier', None) == self.identifier:
+                self.add((s, p, o))
+        return self
+
+    def remove(self, triple):
+        self._hidden.update(list(self._base(triple)))
+        return super().remove(triple)
+
+    def triples(self, triple):
+        yield from super().triples(triple)
+        # paths are evaluated by the calls of this method
+        if not isinstance(triple[1], Path):
+            yield from self._base(triple)
+
+    def __len__(self):
+        return super().__len__() + self.shared
+
+    def _base(self, triple):
+        for statement in self._vocabulary.data.triples(triple):
+            if (statement in self._vocabulary.ground) and (statement not in self._hidden):
+                yield statement
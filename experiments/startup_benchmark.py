@@ -0,0 +1,48 @@
+"""
+Reports import time of csum modules and their heaviest dependencies.
+Every module is imported in a fresh interpreter with -X importtime,
+run from the root of the repository: python experiments/startup_benchmark.py
+"""
+import subprocess
+import sys
+from pathlib import Path
+
+MODULES = ['csum', 'csum.graph', 'csum.raplicator', 'csum.meta', 'csum.main']
+RUNS = 5
+TOP = 5
+ROOT = Path(__file__).parent.parent
+
+
+def import_times(module: str) -> dict:
+    """
+    Imports module in a fresh interpreter
+    :param module: name of the module
+    :return: dictionary name -> cumulative import time in microseconds
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import ' + module],
+                            cwd=ROOT, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    times = dict()
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def main():
+    # modules imported by the interpreter itself, e.g. site
+    startup = set(import_times('sys').keys())
+    for module in MODULES:
+        # the fastest run is the least disturbed one
+        runs = [import_times(module) for _ in range(RUNS)]
+        best = min(runs, key=lambda times: times[module])
+        print("{:<20} {:>8.1f} ms".format(module, best[module] / 1000))
+        dependencies = [(name, time) for name, time in best.items()
+                        if (name not in startup) and ('.' not in name) and (name != 'csum')]
+        for name, time in sorted(dependencies, key=lambda x: -x[1])[:TOP]:
+            print("    {:<16} {:>8.1f} ms".format(name, time / 1000))
+
+
+if __name__ == '__main__':
+    main()